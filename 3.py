@@ -1,21 +1,57 @@
 import re
-import asyncio
-from telethon import TelegramClient
+import importlib
 from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
 import os
-import requests
-import numpy as np
 import time
-import matplotlib.pyplot as plt
+import json
+import hashlib
+import gzip
+import types
+import atexit
+import random
+import heapq
+import threading
+from functools import partial
 from io import BytesIO
 
+class _LazyModule:
+    """İlk öznitelik erişiminde modülü yükler ve global adı gerçek modülle değiştirir"""
+
+    def __init__(self, alias, name, on_load=None):
+        self._alias = alias
+        self._name = name
+        self._on_load = on_load
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        if self._on_load:
+            self._on_load(module)
+        return getattr(module, attr)
+
+# Ağır modüller sadece kullanan komutta yüklenir (telethon ve matplotlib fonksiyon içinde)
+np = _LazyModule("np", "numpy", on_load=lambda m: m.seterr(divide='ignore', invalid='ignore'))
+requests = _LazyModule("requests", "requests")
+asyncio = _LazyModule("asyncio", "asyncio")
+inspect = _LazyModule("inspect", "inspect")
+
 # --- ENV AYARLARI ---
-load_dotenv()
-api_id = int(os.getenv("API_ID"))
-api_hash = os.getenv("API_HASH")
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# .env ilk ihtiyaçta okunur; ayar eksik olsa da modül yüklenebilir
+_env_loaded = False
+
+def config(key, default=None):
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+    return os.getenv(key, default)
+
+def telegram_credentials():
+    api_id = config("API_ID")
+    if not api_id:
+        raise RuntimeError("API_ID ayarlı değil (.env dosyasını kontrol et)")
+    return int(api_id), config("API_HASH")
 
 # --- BALINA (WHALE-ALERT) ENTEGRASYONU ---
 WH_ALERT_CHANNEL = 'whale_alert_io'
@@ -47,13 +83,13 @@ def send_telegram_message_split(msg, max_len=4000):
     for idx, part in enumerate(parts, 1):
         header = f"[{idx}/{total}] 📊 BTC Analiz Raporu\n"
         text = header + part
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+        url = f"https://api.telegram.org/bot{config('TELEGRAM_TOKEN')}/sendMessage"
         data = {
-            "chat_id": TELEGRAM_CHAT_ID,
+            "chat_id": config("TELEGRAM_CHAT_ID"),
             "text": text
         }
         try:
-            r = requests.post(url, data=data, timeout=10)
+            r = http_request("POST", url, "telegram", timeout=10, data=data)
             if r.status_code != 200:
                 print(f"Telegram mesajı gönderilemedi: {r.text}")
             else:
@@ -64,6 +100,158 @@ def send_telegram_message_split(msg, max_len=4000):
 def send_telegram_message(msg):
     send_telegram_message_split(msg, max_len=4000)
 
+# --- YAPILANDIRILMIŞ RAPOR VE SADECE DEĞİŞENİ GÜNCELLEME ---
+REPORT_SECTIONS = [
+    ("whale", "Balina"),
+    ("all_coins", "Tüm Coinler"),
+    ("market", "Piyasa"),
+    ("correlation", "Korelasyon"),
+    ("ta_1h", "1 Saatlik"),
+    ("ta_4h", "4 Saatlik"),
+    ("ta_1d", "1 Günlük"),
+    ("short_term", "Kısa Vade"),
+    ("final", "Nihai Öneri")
+]
+SECTION_TITLES = {
+    "tr": dict(REPORT_SECTIONS),
+    "en": {
+        "whale": "Whales", "all_coins": "All Coins", "market": "Market", "correlation": "Correlation",
+        "ta_1h": "1 Hour", "ta_4h": "4 Hours", "ta_1d": "1 Day", "short_term": "Short Term",
+        "final": "Final Call"
+    }
+}
+REPORT_HEADERS = {"tr": "📊 BTC Analiz Raporu", "en": "📊 BTC Analysis Report"}
+# Boşsa TELEGRAM_STATE_FILE ayarı kullanılır; tekrar oynatma kendi dosyasını atar
+TELEGRAM_STATE_FILE = None
+# TELEGRAM_UPDATE_MODE ayarı: edit (değişeni yerinde düzenle), skip (değişeni yeni mesaj at), full (hepsini at)
+_TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}")
+
+def build_report_sections(whale, all_coins, market, ta_1h, ta_4h, ta_1d, short_term, final,
+                          correlation=None):
+    texts = {
+        "whale": whale, "all_coins": all_coins, "market": market, "correlation": correlation,
+        "ta_1h": ta_1h, "ta_4h": ta_4h, "ta_1d": ta_1d, "short_term": short_term, "final": final
+    }
+    return [(key, texts[key]) for key, _ in REPORT_SECTIONS if texts[key] is not None]
+
+def join_report_sections(sections):
+    return "\n".join(text for _, text in sections)
+
+def section_hash(text):
+    # Rapor saatleri her çalıştırmada değişir; içerik karşılaştırmasına katılmaz
+    return hashlib.sha1(_TIMESTAMP_RE.sub("", text).encode("utf-8")).hexdigest()
+
+def split_message(text, max_len=4000):
+    return [text[i:i + max_len] for i in range(0, len(text), max_len)] or [""]
+
+def _telegram_api(method, **data):
+    url = f"https://api.telegram.org/bot{config('TELEGRAM_TOKEN')}/{method}"
+    r = http_request("POST", url, "telegram", timeout=10, data=data)
+    try:
+        body = r.json()
+    except ValueError:
+        body = {"ok": False, "description": r.text}
+    return body
+
+class TelegramReportSender:
+    """Bölüm başına mesaj kimliklerini ve içerik özetlerini hatırlayarak sadece değişeni gönderir"""
+
+    _state_lock = threading.Lock()
+
+    def __init__(self, chat_id=None, state_file=None, mode=None, lang="tr", state_key=None):
+        self.chat_id = str(chat_id or config("TELEGRAM_CHAT_ID"))
+        # Aynı sohbette birden çok abonelik olabilir; mesaj kimlikleri abonelik başına ayrı tutulur
+        self.state_key = str(state_key or self.chat_id)
+        self.lang = lang
+        self.state_file = state_file or TELEGRAM_STATE_FILE or config("TELEGRAM_STATE_FILE", "telegram_state.json")
+        self.mode = mode or config("TELEGRAM_UPDATE_MODE", "edit")
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                return json.load(f).get(self.state_key, {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        # Abonelere eşzamanlı gönderimde tüm sohbetler aynı dosyayı paylaşır
+        with self._state_lock:
+            try:
+                with open(self.state_file, encoding="utf-8") as f:
+                    all_state = json.load(f)
+            except (OSError, ValueError):
+                all_state = {}
+            all_state[self.state_key] = self.state
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(all_state, f, ensure_ascii=False)
+            os.replace(tmp, self.state_file)
+
+    def _send(self, text):
+        body = _telegram_api("sendMessage", chat_id=self.chat_id, text=text)
+        if not body.get("ok"):
+            print(f"Telegram mesajı gönderilemedi: {body.get('description')}")
+            return None
+        return body["result"]["message_id"]
+
+    def _edit(self, message_id, text):
+        body = _telegram_api("editMessageText", chat_id=self.chat_id, message_id=message_id, text=text)
+        return body.get("ok") or "message is not modified" in str(body.get("description", ""))
+
+    def _delete(self, message_id):
+        _telegram_api("deleteMessage", chat_id=self.chat_id, message_id=message_id)
+
+    def _render_parts(self, key, text):
+        title = SECTION_TITLES[self.lang].get(key, key)
+        header = REPORT_HEADERS[self.lang]
+        parts = split_message(text)
+        return [f"[{i}/{len(parts)}] {header} • {title}\n{part}" for i, part in enumerate(parts, 1)]
+
+    def send_section(self, key, text):
+        digest = section_hash(text)
+        prev = self.state.get(key)
+        if prev and prev["hash"] == digest:
+            return "unchanged"
+        parts = self._render_parts(key, text)
+        part_hashes = [section_hash(p) for p in parts]
+        old_ids = prev["message_ids"] if prev and self.mode == "edit" else []
+        old_hashes = prev.get("part_hashes", []) if prev else []
+        ids = []
+        for i, part in enumerate(parts):
+            if i < len(old_ids):
+                if i < len(old_hashes) and old_hashes[i] == part_hashes[i]:
+                    ids.append(old_ids[i])
+                    continue
+                if self._edit(old_ids[i], part):
+                    ids.append(old_ids[i])
+                    continue
+            ids.append(self._send(part))
+        for message_id in old_ids[len(parts):]:
+            self._delete(message_id)
+        if None in ids:
+            # Bir parça gitmediyse bir sonraki turda tekrar denensin
+            self.state.pop(key, None)
+            return "failed"
+        self.state[key] = {"hash": digest, "part_hashes": part_hashes, "message_ids": ids}
+        return "edited" if old_ids else "sent"
+
+    def send_report(self, sections):
+        if self.mode == "full":
+            parts = split_message(join_report_sections(sections))
+            header = REPORT_HEADERS[self.lang]
+            sent = [self._send(f"[{i}/{len(parts)}] {header}\n{part}") for i, part in enumerate(parts, 1)]
+            return {"full": "failed" if None in sent else "sent"}
+        results = {}
+        for key, text in sections:
+            try:
+                results[key] = self.send_section(key, text)
+            except Exception as e:
+                print(f"{key} bölümü gönderilemedi: {e}")
+                results[key] = "failed"
+        self._save()
+        return results
+
 def parse_whale_alert(text):
     if not text:
         return None
@@ -73,10 +261,39 @@ def parse_whale_alert(text):
     if not m:
         return None
     amount = float(m.group(1).replace(',', ''))
-    coin = m.group(2).upper()
     usd = float(m.group(3).replace(',', ''))
-    from_acct = m.group(4).lower()
-    to_acct = m.group(5).lower()
+    return whale_transfer(amount, m.group(2), usd, m.group(4), m.group(5), amount_tol=0.5)
+
+_SUFFIX_MULT = {"": 1, "K": 1e3, "M": 1e6, "B": 1e9}
+
+def amount_tolerance(number, suffix=""):
+    # Yazılan son basamağın yarısı: "1.2K" ±50, "1,234" ±0.5
+    decimals = len(number.partition(".")[2])
+    return 0.5 * 10 ** -decimals * _SUFFIX_MULT[suffix]
+
+def parse_compact_whale_alert(text):
+    # "1.2K #ETH ($3.4M) moved from binance to unknown wallet" gibi kısaltmalı formatlar
+    if not text:
+        return None
+    m = re.search(
+        r'([\d.,]+)\s*([KMB]?)\s+#?([A-Za-z0-9]+)[^\n]*?\(\$\s*([\d.,]+)\s*([KMB]?)\).*?from (.+?) to (.+?)(?:\.|$|\n)',
+        text)
+    if not m:
+        return None
+    amount = float(m.group(1).replace(',', '')) * _SUFFIX_MULT[m.group(2)]
+    usd = float(m.group(4).replace(',', '')) * _SUFFIX_MULT[m.group(5)]
+    return whale_transfer(amount, m.group(3), usd, m.group(6), m.group(7),
+                          amount_tol=amount_tolerance(m.group(1).replace(',', ''), m.group(2)))
+
+WHALE_PARSERS = {
+    "whale_alert": parse_whale_alert,
+    "compact": parse_compact_whale_alert,
+}
+
+def whale_transfer(amount, coin, usd, from_acct, to_acct, amount_tol=0.0):
+    coin = coin.upper()
+    from_acct = from_acct.strip().lower()
+    to_acct = to_acct.strip().lower()
     from_is_exchange = any(x in from_acct for x in EXCHANGES)
     to_is_exchange = any(x in to_acct for x in EXCHANGES)
     if to_is_exchange:
@@ -87,6 +304,7 @@ def parse_whale_alert(text):
         direction = "other"
     return {
         "amount": amount,
+        "amount_tol": amount_tol,
         "coin": coin,
         "usd": usd,
         "from": from_acct,
@@ -107,7 +325,8 @@ def analyze_period(messages, t0, t1):
             summary[c] = {
                 "in_amount": 0, "out_amount": 0,
                 "usd_in": 0, "usd_out": 0,
-                "adet_in": 0, "adet_out": 0
+                "adet_in": 0, "adet_out": 0,
+                "usd_net_px": 0
             }
         if m["to_is_exchange"] and m["from_is_exchange"]:
             summary[c]["in_amount"] += m["amount"]
@@ -128,10 +347,12 @@ def analyze_period(messages, t0, t1):
             summary[c]["in_amount"] += m["amount"]
             summary[c]["usd_in"] += m["usd"]
             summary[c]["adet_in"] += 1
+            summary[c]["usd_net_px"] += m.get("usd_px", m["usd"])
         elif m["direction"] == "out":
             summary[c]["out_amount"] += m["amount"]
             summary[c]["usd_out"] += m["usd"]
             summary[c]["adet_out"] += 1
+            summary[c]["usd_net_px"] -= m.get("usd_px", m["usd"])
     return summary, xchain_transfers
 
 def analyze_all_periods(messages, now):
@@ -147,74 +368,557 @@ def analyze_all_periods(messages, now):
             data = summary.get(coin, {
                 "in_amount": 0, "out_amount": 0,
                 "usd_in": 0, "usd_out": 0,
-                "adet_in": 0, "adet_out": 0
+                "adet_in": 0, "adet_out": 0,
+                "usd_net_px": 0
             })
             per_coin[coin].append((label, data))
             per_coin_xchain[coin].append((label, xchain_transfers.get(coin, [])))
     return per_coin, per_coin_xchain
 
+# --- DAYANIKLILIK: SÜRE BÜTÇESİ, GERİ ÇEKİLME, DEVRE KESİCİ ---
+class SourceUnavailable(Exception):
+    """Devre kesici açık ya da süre bütçesi bittiği için kaynağa gidilmedi"""
+
+class CircuitBreaker:
+    """Art arda hatalardan sonra açılır, soğuma süresi boyunca çağrıları anında reddeder"""
+
+    def __init__(self, name, failure_threshold=3, cooldown=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        # Yarı açık durumda yalnızca tek bir deneme çağrısı geçer; sonuçlanana kadar diğerleri reddedilir.
+        # Sonuç hiç bildirilmezse (ör. istek gönderilmeden vazgeçildi) deneme hakkı bir soğuma süresi sonra yenilenir
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            now = time.monotonic()
+            if self.probe_at is not None and now - self.probe_at < self.cooldown:
+                return False
+            self.probe_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_at = None
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+BREAKERS = {
+    "coingecko": CircuitBreaker("coingecko", failure_threshold=3, cooldown=300),
+    "binance_spot": CircuitBreaker("binance_spot", failure_threshold=3, cooldown=60),
+    "binance_futures": CircuitBreaker("binance_futures", failure_threshold=3, cooldown=60),
+    "telegram": CircuitBreaker("telegram", failure_threshold=3, cooldown=60)
+}
+
+class RunDeadline:
+    """Tek bir çalıştırmanın toplam süre sınırı ve kaynak başına süre bütçeleri"""
+
+    def __init__(self, total, budgets=None):
+        self.end = time.monotonic() + total
+        self.budgets = dict(budgets or {})
+        self.spent = {}
+        self._lock = threading.Lock()
+
+    def remaining(self, source=None):
+        rem = self.end - time.monotonic()
+        if source in self.budgets:
+            rem = min(rem, self.budgets[source] - self.spent.get(source, 0))
+        return rem
+
+    def charge(self, source, seconds):
+        with self._lock:
+            self.spent[source] = self.spent.get(source, 0) + seconds
+
+RUN_DEADLINE_SECONDS = 60
+SOURCE_BUDGETS = {
+    "telegram_mtproto": 20,
+    "coingecko": 15,
+    "binance_spot": 25,
+    "binance_futures": 15,
+    "telegram": 15
+}
+_active_deadline = None
+
+def set_run_deadline(deadline):
+    global _active_deadline
+    _active_deadline = deadline
+
+def deadline_remaining(source=None):
+    return None if _active_deadline is None else _active_deadline.remaining(source)
+
+def charge_deadline(source, seconds):
+    if _active_deadline is not None:
+        _active_deadline.charge(source, seconds)
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    # "Full jitter": aynı anda hata alan çağrılar aynı anda tekrar denemesin
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# --- BINANCE İSTEK AĞIRLIĞI BÜTÇESİ ---
+# IP başına dakikalık ağırlık limitleri; güvenlik payı ile bunun altında kalınır
+BINANCE_WEIGHT_LIMITS = {"binance_spot": 6000, "binance_futures": 2400}
+BINANCE_WEIGHT_SAFETY = 0.8
+# Kısa vadeli veriler önce, günlük veriler en son (küçük sayı = yüksek öncelik)
+BINANCE_INTERVAL_PRIORITY = {"1m": 0, "5m": 0, "15m": 1, "30m": 1, "1h": 2, "4h": 3, "1d": 4}
+
+def _url_params(url):
+    query = url.split("?", 1)[1] if "?" in url else ""
+    return dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+
+def binance_endpoint_weight(url):
+    path = url.split("?", 1)[0]
+    params = _url_params(url)
+    limit = int(params.get("limit", 0) or 0)
+    if path.endswith("/api/v3/depth"):
+        if limit <= 100:
+            return 5
+        if limit <= 500:
+            return 25
+        if limit <= 1000:
+            return 50
+        return 250
+    if path.endswith("/api/v3/klines"):
+        return 2
+    if path.endswith("/fapi/v1/klines"):
+        if limit < 100:
+            return 1
+        if limit < 500:
+            return 2
+        if limit <= 1000:
+            return 5
+        return 10
+    if "/futures/data/" in path:
+        # Bu uç noktalar dakikalık ağırlığa değil ayrı bir IP limitine tabi
+        return 0
+    return 1
+
+def binance_request_priority(url):
+    path = url.split("?", 1)[0]
+    if path.endswith("/depth"):
+        return 0
+    params = _url_params(url)
+    interval = params.get("interval") or params.get("period")
+    return BINANCE_INTERVAL_PRIORITY.get(interval, 2)
+
+class BinanceWeightBudget:
+    """Dakikalık ağırlık bütçesi; bekleyen istekleri önceliğe göre sıraya alır"""
+
+    def __init__(self, name, limit, safety=BINANCE_WEIGHT_SAFETY):
+        self.name = name
+        self.limit = int(limit * safety)
+        self.used = 0
+        self.window = int(time.time() // 60)
+        self.banned_until = 0
+        self._waiting = []
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def _roll_window(self, now):
+        # Binance sayacı takvim dakikası başında sıfırlanır
+        window = int(now // 60)
+        if window != self.window:
+            self.window = window
+            self.used = 0
+
+    def acquire(self, weight, priority=2, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._seq += 1
+            entry = (priority, self._seq)
+            heapq.heappush(self._waiting, entry)
+            while True:
+                now = time.time()
+                self._roll_window(now)
+                if now < self.banned_until:
+                    wait = self.banned_until - now
+                elif self._waiting[0] != entry:
+                    wait = None
+                elif self.used + weight <= self.limit or self.used == 0:
+                    heapq.heappop(self._waiting)
+                    self.used += weight
+                    self._cond.notify_all()
+                    return
+                else:
+                    wait = (self.window + 1) * 60 - now
+                if end is not None:
+                    left = end - time.monotonic()
+                    if left <= 0:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        self._cond.notify_all()
+                        raise SourceUnavailable(f"{self.name} ağırlık bütçesi beklenirken süre doldu")
+                    wait = left if wait is None else min(wait, left)
+                self._cond.wait(wait)
+
+    def update_from_response(self, r):
+        with self._cond:
+            now = time.time()
+            self._roll_window(now)
+            used = r.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used is not None:
+                try:
+                    # Uçuştaki isteklerin rezervasyonu kaybolmasın diye büyük olan tutulur
+                    self.used = max(self.used, int(used))
+                except ValueError:
+                    pass
+            if r.status_code in (418, 429):
+                try:
+                    retry_after = int(r.headers.get("Retry-After", 60))
+                except ValueError:
+                    retry_after = 60
+                self.banned_until = max(self.banned_until, now + retry_after)
+                print(f"{self.name}: HTTP {r.status_code}, {retry_after} sn bekleniyor.")
+            self._cond.notify_all()
+
+BINANCE_BUDGETS = {
+    name: BinanceWeightBudget(name, limit) for name, limit in BINANCE_WEIGHT_LIMITS.items()
+}
+
+# --- KAYIT / TEKRAR OYNATMA (ÇEVRİMDIŞI UÇTAN UCA ÇALIŞTIRMA) ---
+RECORDED_HEADERS = ("Content-Type", "X-MBX-USED-WEIGHT-1M", "Retry-After")
+_BOT_TOKEN_RE = re.compile(r"/bot[^/]+/")
+# Aralık istekleri duvar saatinden startTime/endTime üretir; anahtarda sadece yol ve diğer parametreler kalır
+_TIME_PARAM_RE = re.compile(r"([?&](?:startTime|endTime)=)\d+")
+TRANSPORT = {"mode": "live", "archive": None, "latency_scale": 0.0, "shift": timedelta(0)}
+
+class FixtureArchive:
+    """Dış kaynak yanıtlarını ve Telegram kanal mesajlarını tek gzip JSON dosyasında saklar"""
+
+    def __init__(self, path):
+        self.path = path
+        self.recorded_at = datetime.now(timezone.utc).isoformat()
+        self.http = {}
+        self.channels = {}
+        self.outbox = []
+        self.misses = []
+        self._cursor = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_key(key):
+        # Bot token'ı arşive yazılmaz
+        return _TIME_PARAM_RE.sub(r"\1*", _BOT_TOKEN_RE.sub("/bot<TOKEN>/", key))
+
+    @classmethod
+    def request_key(cls, method, url):
+        return cls.normalize_key(f"{method.upper()} {url}")
+
+    def add_http(self, method, url, r, elapsed):
+        entry = {
+            "status": r.status_code,
+            "headers": {h: r.headers[h] for h in RECORDED_HEADERS if h in r.headers},
+            "body": r.text,
+            "elapsed": round(elapsed, 4)
+        }
+        with self._lock:
+            self.http.setdefault(self.request_key(method, url), []).append(entry)
+
+    def next_http(self, method, url):
+        # Aynı istek birden çok kaydedildiyse sırayla döner, sonuncuda kalır
+        key = self.request_key(method, url)
+        with self._lock:
+            entries = self.http.get(key)
+            if not entries:
+                return None
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = min(i + 1, len(entries) - 1)
+            return entries[i]
+
+    def add_message(self, channel, msg):
+        self.channels.setdefault(channel, {})[msg.id] = {
+            "id": msg.id, "text": msg.text, "date": msg.date.isoformat()
+        }
+
+    def save(self):
+        data = {
+            "recorded_at": self.recorded_at,
+            "http": self.http,
+            "channels": {ch: sorted(msgs.values(), key=lambda m: m["id"]) for ch, msgs in self.channels.items()}
+        }
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"Kayıt arşivi yazıldı: {self.path} ({sum(len(v) for v in self.http.values())} HTTP yanıtı)")
+
+    @classmethod
+    def load(cls, path):
+        archive = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        archive.recorded_at = data["recorded_at"]
+        # Eski arşivlerde zaman parametreleri anahtardaydı; kayıt sırası korunarak birleştirilir
+        for key, entries in data["http"].items():
+            archive.http.setdefault(cls.normalize_key(key), []).extend(entries)
+        archive.channels = {ch: {m["id"]: m for m in msgs} for ch, msgs in data["channels"].items()}
+        return archive
+
+class ReplayResponse:
+    """requests.Response yerine geçen, arşivden üretilmiş yanıt"""
+
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.text = body
+        self.content = body.encode("utf-8")
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+def set_transport(mode, path=None, latency_scale=0.0):
+    global TELEGRAM_STATE_FILE
+    TRANSPORT["mode"] = mode
+    TRANSPORT["latency_scale"] = latency_scale
+    TRANSPORT["shift"] = timedelta(0)
+    if mode == "record":
+        TRANSPORT["archive"] = FixtureArchive(path)
+        atexit.register(TRANSPORT["archive"].save)
+    elif mode == "replay":
+        TRANSPORT["archive"] = FixtureArchive.load(path)
+        # Tekrar oynatma gerçek sohbetin mesaj kimliklerini bozmasın
+        TELEGRAM_STATE_FILE = path + ".telegram_state.json"
+    else:
+        TRANSPORT["archive"] = None
+
+def _replay_telegram_bot(method, url, kwargs):
+    archive = TRANSPORT["archive"]
+    data = kwargs.get("data") or {}
+    archive.outbox.append({"method": url.rsplit("/", 1)[-1], "data": dict(data)})
+    result = {"message_id": len(archive.outbox)} if "sendMessage" in url else True
+    return ReplayResponse(200, json.dumps({"ok": True, "result": result}))
+
+def transport_request(method, url, timeout=10, **kwargs):
+    mode = TRANSPORT["mode"]
+    if mode == "replay":
+        archive = TRANSPORT["archive"]
+        if "api.telegram.org" in url:
+            return _replay_telegram_bot(method, url, kwargs)
+        entry = archive.next_http(method, url)
+        if entry is None:
+            # Devre kesiciyi açmasın ama gözden kaçmasın: komut sonunda listelenir ve hata koduyla çıkılır
+            key = archive.request_key(method, url)
+            archive.misses.append(key)
+            print(f"⚠️ Tekrar oynatma: arşivde kayıt yok: {key}")
+            raise SourceUnavailable(f"Arşivde kayıt yok: {key}")
+        if TRANSPORT["latency_scale"]:
+            time.sleep(entry["elapsed"] * TRANSPORT["latency_scale"])
+        return ReplayResponse(entry["status"], entry["body"], entry["headers"])
+    t0 = time.monotonic()
+    r = requests.request(method, url, timeout=timeout, **kwargs)
+    if mode == "record" and "api.telegram.org" not in url:
+        TRANSPORT["archive"].add_http(method, url, r, time.monotonic() - t0)
+    return r
+
+class RecordingTelegramClient:
+    """Gerçek Telethon istemcisini sarar, çekilen kanal mesajlarını arşive yazar"""
+
+    def __init__(self, client, archive):
+        self._client = client
+        self._archive = archive
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def iter_messages(self, entity, *args, **kwargs):
+        async for msg in self._client.iter_messages(entity, *args, **kwargs):
+            self._archive.add_message(entity, msg)
+            yield msg
+
+class ReplayTelegramClient:
+    """Arşivdeki kanal mesajlarını Telethon arayüzüyle sunar; zamanlar bugüne kaydırılır"""
+
+    def __init__(self, archive):
+        self._archive = archive
+        self._shift = datetime.now(timezone.utc) - datetime.fromisoformat(archive.recorded_at)
+        # Fiyat eşlemesi kaydırmayı geri alır; arşivdeki mumlar kayıt anının zamanlarını taşır
+        TRANSPORT["shift"] = self._shift
+
+    async def start(self):
+        return self
+
+    async def disconnect(self):
+        return None
+
+    def on(self, *args, **kwargs):
+        return lambda handler: handler
+
+    async def iter_messages(self, entity, limit=None, min_id=0, **kwargs):
+        msgs = sorted(self._archive.channels.get(entity, {}).values(), key=lambda m: -m["id"])
+        for n, m in enumerate(x for x in msgs if x["id"] > min_id):
+            if limit is not None and n >= limit:
+                break
+            if TRANSPORT["latency_scale"]:
+                await asyncio.sleep(0.001 * TRANSPORT["latency_scale"])
+            yield types.SimpleNamespace(
+                id=m["id"], text=m["text"], date=datetime.fromisoformat(m["date"]) + self._shift)
+
+def make_telegram_client():
+    mode = TRANSPORT["mode"]
+    if mode == "replay":
+        return ReplayTelegramClient(TRANSPORT["archive"])
+    from telethon import TelegramClient
+    client = TelegramClient('anon', *telegram_credentials())
+    if mode == "record":
+        return RecordingTelegramClient(client, TRANSPORT["archive"])
+    return client
+
+def bench_pipeline(path, runs=3, latency_scale=0.0):
+    import statistics
+    # Kaydedilmiş arşivle main() uçtan uca, ağ olmadan ölçülür
+    set_transport("replay", path, latency_scale)
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    samples = []
+    for _ in range(runs):
+        for breaker in BREAKERS.values():
+            breaker.record_success()
+        t0 = time.perf_counter()
+        asyncio.run(main())
+        samples.append(time.perf_counter() - t0)
+    if TRANSPORT["archive"].misses:
+        raise RuntimeError(f"Arşivde olmayan {len(TRANSPORT['archive'].misses)} istek; ölçüm geçersiz")
+    print(f"Uçtan uca (tekrar oynatma, {runs} tur): medyan {statistics.median(samples):.3f} sn, en iyi {min(samples):.3f} sn")
+    return samples
+
+def http_request(method, url, source, timeout=10, max_retry=1, **kwargs):
+    breaker = BREAKERS.get(source)
+    last_error = None
+    for attempt in range(max_retry):
+        remaining = deadline_remaining(source)
+        if remaining is not None and remaining <= 0:
+            raise SourceUnavailable(f"{source} süre bütçesi doldu")
+        if breaker and not breaker.allow():
+            raise SourceUnavailable(f"{source} devre kesici açık")
+        if remaining is not None:
+            timeout = max(0.5, min(timeout, remaining))
+        budget = BINANCE_BUDGETS.get(source)
+        if budget:
+            budget.acquire(binance_endpoint_weight(url), binance_request_priority(url), timeout=remaining)
+        t0 = time.monotonic()
+        try:
+            r = transport_request(method, url, timeout=timeout, **kwargs)
+            if budget:
+                budget.update_from_response(r)
+            if r.status_code in (418, 429) or r.status_code >= 500:
+                raise requests.HTTPError(f"HTTP {r.status_code}", response=r)
+            if breaker:
+                breaker.record_success()
+            return r
+        except requests.RequestException as e:
+            last_error = e
+            if breaker:
+                breaker.record_failure()
+            if budget and e.response is not None and e.response.status_code in (418, 429):
+                # Limit aşımında tekrar denemek yasak süresini uzatır
+                break
+        finally:
+            charge_deadline(source, time.monotonic() - t0)
+        if attempt + 1 < max_retry:
+            delay = backoff_delay(attempt)
+            remaining = deadline_remaining(source)
+            if remaining is not None and delay >= remaining:
+                break
+            time.sleep(delay)
+    raise last_error
+
 def safe_api_call(func, max_retry=5, wait=5, *args, **kwargs):
     last_error = None
-    for _ in range(max_retry):
+    for attempt in range(max_retry):
         try:
             result = func(*args, **kwargs)
             return result
+        except SourceUnavailable as e:
+            last_error = e
+            break
         except Exception as e:
             last_error = e
-            time.sleep(wait)
+            delay = backoff_delay(attempt, base=0.5, cap=wait)
+            remaining = deadline_remaining()
+            if remaining is not None and delay >= remaining:
+                break
+            time.sleep(delay)
     return None if last_error is None else (None, str(last_error))
 
+def get_coingecko_daily_batch(coins):
+    # Tüm coinler tek istekte; coin başına ayrı /coins çağrısına gerek yok
+    ids = {COINGECKO_IDS[c]: c for c in coins if c in COINGECKO_IDS}
+    url = (
+        "https://api.coingecko.com/api/v3/simple/price"
+        f"?ids={','.join(ids)}&vs_currencies=usd&include_24hr_vol=true"
+    )
+    data = http_request("GET", url, "coingecko", timeout=15, max_retry=3).json()
+    out = {}
+    for cg_id, coin in ids.items():
+        row = data.get(cg_id) or {}
+        volume = row.get("usd_24h_vol")
+        price = row.get("usd")
+        out[coin] = (
+            float(volume) if volume is not None else None,
+            float(price) if price is not None else None
+        )
+    return out
+
+def _coingecko_market_data(coin):
+    cg_id = COINGECKO_IDS[coin]
+    url = f"https://api.coingecko.com/api/v3/coins/{cg_id}?localization=false&tickers=false&market_data=true"
+    try:
+        data = http_request("GET", url, "coingecko", timeout=15, max_retry=3).json()
+    except Exception as e:
+        return None, str(e)
+    market_data = data.get("market_data")
+    if not market_data:
+        return None, "market_data yok"
+    return market_data, None
+
 def get_daily_volume_usd(coin):
     if coin not in COINGECKO_IDS:
         return None, "ID yok"
-    cg_id = COINGECKO_IDS[coin]
-    url = f"https://api.coingecko.com/api/v3/coins/{cg_id}?localization=false&tickers=false&market_data=true"
-    for _ in range(5):
-        try:
-            r = requests.get(url, timeout=15)
-            r.raise_for_status()
-            data = r.json()
-            if "status" in data and data["status"].get("error_code") == 429:
-                time.sleep(10)
-                continue
-            time.sleep(3)
-            market_data = data.get("market_data")
-            if not market_data:
-                return None, "market_data yok"
-            total_volume = market_data.get("total_volume")
-            if not total_volume or "usd" not in total_volume:
-                return None, "total_volume yok"
-            return float(total_volume["usd"]), None
-        except Exception as e:
-            time.sleep(5)
-    return None, "get_daily_volume_usd hata"
+    market_data, err = _coingecko_market_data(coin)
+    if err:
+        return None, err
+    total_volume = market_data.get("total_volume")
+    if not total_volume or "usd" not in total_volume:
+        return None, "total_volume yok"
+    return float(total_volume["usd"]), None
 
 def get_daily_price(coin):
     if coin not in COINGECKO_IDS:
         return None, "ID yok"
-    cg_id = COINGECKO_IDS[coin]
-    url = f"https://api.coingecko.com/api/v3/coins/{cg_id}?localization=false&tickers=false&market_data=true"
-    for _ in range(5):
-        try:
-            r = requests.get(url, timeout=15)
-            r.raise_for_status()
-            data = r.json()
-            if "status" in data and data["status"].get("error_code") == 429:
-                time.sleep(10)
-                continue
-            time.sleep(3)
-            market_data = data.get("market_data")
-            if not market_data:
-                return None, "market_data yok"
-            current_price = market_data.get("current_price")
-            if not current_price or "usd" not in current_price:
-                return None, "current_price yok"
-            return float(current_price["usd"]), None
-        except Exception as e:
-            time.sleep(5)
-    return None, "get_daily_price hata"
+    market_data, err = _coingecko_market_data(coin)
+    if err:
+        return None, err
+    current_price = market_data.get("current_price")
+    if not current_price or "usd" not in current_price:
+        return None, "current_price yok"
+    return float(current_price["usd"]), None
 
-def yorum_uret(fark, gunluk_hacim, yon, hacim_var):
+def yorum_uret(fark, gunluk_hacim, yon, hacim_var, z=None):
+    # z verilirse (dedektör ısınmışsa) şiddet coin'in kendi geçmişine göre, yoksa sabit %1/%5 eşikleriyle
     if not hacim_var:
         return "⚠️ CoinGecko veri eksik, oran ve öneri üretilemedi."
     oran = 0
@@ -223,20 +927,28 @@ def yorum_uret(fark, gunluk_hacim, yon, hacim_var):
     oran_s = f"{oran:.2f}%"
     if fark == 0 or gunluk_hacim is None or gunluk_hacim == 0:
         return f"🟡 Baskı yok, piyasa nötr. (Günlük hacme oran: {oran_s})"
+    if z is None:
+        seviye = 0 if oran < 1 else 1 if oran < 5 else 2
+    else:
+        # z net akışın (giriş - çıkış) skoru; sadece yön doğrultusundaki sapma şiddeti artırır,
+        # ters işaretli z olağandışı zayıf akış demektir
+        z_yon = z if yon == 'in' else -z
+        seviye = 0 if z_yon < 2 else 1 if z_yon < ANOMALY_Z_THRESHOLD else 2
+    ek = f"(Günlük hacme oran: {oran_s}{z_etiketi(z)})"
     if yon == 'out':
-        if oran < 1:
-            return f"🟡 Hafif alım baskısı var, piyasa yatay veya nötr. (Günlük hacme oran: {oran_s})"
-        elif oran < 5:
-            return f"🟢 Alım baskısı hissediliyor, hareket başlayabilir. (Günlük hacme oran: {oran_s})"
+        if seviye == 0:
+            return f"🟡 Hafif alım baskısı var, piyasa yatay veya nötr. {ek}"
+        elif seviye == 1:
+            return f"🟢 Alım baskısı hissediliyor, hareket başlayabilir. {ek}"
         else:
-            return f"🟢 Güçlü alım baskısı! Piyasa alıma dönüyor, hareketli gün olabilir. (Günlük hacme oran: {oran_s})"
+            return f"🟢 Güçlü alım baskısı! Piyasa alıma dönüyor, hareketli gün olabilir. {ek}"
     else:
-        if oran < 1:
-            return f"🟡 Hafif satış baskısı var, piyasa yatay veya nötr. (Günlük hacme oran: {oran_s})"
-        elif oran < 5:
-            return f"🔴 Satış baskısı hissediliyor, hareket başlayabilir. (Günlük hacme oran: {oran_s})"
+        if seviye == 0:
+            return f"🟡 Hafif satış baskısı var, piyasa yatay veya nötr. {ek}"
+        elif seviye == 1:
+            return f"🔴 Satış baskısı hissediliyor, hareket başlayabilir. {ek}"
         else:
-            return f"🔴 Güçlü satış baskısı! Piyasa satıma dönüyor, dikkatli ol. (Günlük hacme oran: {oran_s})"
+            return f"🔴 Güçlü satış baskısı! Piyasa satıma dönüyor, dikkatli ol. {ek}"
 def get_period_yon(data):
     fark = data['in_amount'] - data['out_amount']
     if fark > 0:
@@ -247,20 +959,22 @@ def get_period_yon(data):
         return None
 
 def format_btc_whale_report(all_period_data, all_xchain_data,
-                            gunluk_hacim, gunluk_fiyat, hacim_var, hacim_error, now_tr):
+                            gunluk_hacim, gunluk_fiyat, hacim_var, hacim_error, now_tr, zscores=None):
+    zscores = zscores or [None] * len(all_period_data)
     out = [f"\n━━ 🐋 Balina Transfer Analizi ━━"]
     out.append(f"Tarih/Saat (TSI): {now_tr}\n")
     if not hacim_var:
         out.append(
             f"⚠️ CoinGecko veri eksik: {hacim_error}. Bu coin için oran ve öneri gösterilemiyor.")
     son_data = all_period_data[-1][1]
-    fark = son_data["in_amount"] - son_data["out_amount"]
     yon = get_period_yon(son_data)
+    # Net akış her transferin kendi zamanındaki fiyatla değerlenir (price_whale_messages)
     genel_yorum = yorum_uret(
-        fark * gunluk_fiyat if gunluk_fiyat else fark,
+        son_data["usd_net_px"],
         gunluk_hacim,
         yon,
-        hacim_var)
+        hacim_var,
+        zscores[-1])
     out.append(genel_yorum)
     for i, (label, data) in enumerate(all_period_data):
         fark_amount = data["in_amount"] - data["out_amount"]
@@ -283,11 +997,11 @@ def format_btc_whale_report(all_period_data, all_xchain_data,
             out.append(
                 f"    ↪️ Ekstra: {x['amount']:,.2f} BTC ({x['usd']:,.0f} USD) {label} diliminde {x['from']} platformundan {x['to']} platformuna transfer edildi."
             )
-        yorum = yorum_uret(fark_usd, gunluk_hacim, yon, hacim_var)
+        yorum = yorum_uret(fark_usd, gunluk_hacim, yon, hacim_var, zscores[i])
         out.append("    " + yorum)
     return "\n".join(out)
 
-def format_all_coins_whale_report(per_coin, per_coin_xchain, gunluk_hacimler, gunluk_fiyatlar, now_tr):
+def format_all_coins_whale_report(per_coin, per_coin_xchain, gunluk_hacimler, gunluk_fiyatlar, now_tr, zscores=None):
     out = ["\n━━ 🐋 Balina Transfer Analizi (Tüm Coinler) ━━"]
     out.append(f"Tarih/Saat (TSI): {now_tr}\n")
     for coin in per_coin:
@@ -297,16 +1011,16 @@ def format_all_coins_whale_report(per_coin, per_coin_xchain, gunluk_hacimler, gu
             continue  # BTC zaten yukarıda detaylı veriliyor
         all_period_data = per_coin[coin]
         gunluk_hacim = gunluk_hacimler.get(coin)
-        gunluk_fiyat = gunluk_fiyatlar.get(coin)
         hacim_var = gunluk_hacim is not None
         son_data = all_period_data[-1][1]
-        fark = son_data["in_amount"] - son_data["out_amount"]
         yon = get_period_yon(son_data)
+        coin_z = (zscores or {}).get(coin) or [None] * len(all_period_data)
         genel_yorum = yorum_uret(
-            fark * gunluk_fiyat if gunluk_fiyat else fark,
+            son_data["usd_net_px"],
             gunluk_hacim,
             yon,
-            hacim_var)
+            hacim_var,
+            coin_z[-1])
         out.append(f"\n[{coin}] {genel_yorum}")
         for i, (label, data) in enumerate(all_period_data):
             fark_amount = data["in_amount"] - data["out_amount"]
@@ -319,23 +1033,25 @@ def format_all_coins_whale_report(per_coin, per_coin_xchain, gunluk_hacimler, gu
                 gunluk_hacim and hacim_var) else 0
             oran_s = f"{oran:.2f}%"
             out.append(
-                f"{label}: Giriş: {data['in_amount']:,.2f} {coin} | Çıkış: {data['out_amount']:,.2f} {coin} | Fark: {fark_amount:,.2f} {coin} | Oran: {oran_s if hacim_var else '-'}"
+                f"{label}: Giriş: {data['in_amount']:,.2f} {coin} | Çıkış: {data['out_amount']:,.2f} {coin} | Fark: {fark_amount:,.2f} {coin} | Oran: {oran_s if hacim_var else '-'}{z_etiketi(coin_z[i])}"
             )
         out.append("-" * 40)
     return "\n".join(out)
 
-def get_order_book_depth(symbol="BTCUSDT", limit=20):
+def get_order_book_depth(symbol="BTCUSDT", limit=20, strict=False):
     try:
         url = f"https://api.binance.com/api/v3/depth?symbol={symbol}&limit={limit}"
-        data = requests.get(url, timeout=10).json()
+        data = http_request("GET", url, "binance_spot").json()
         bids = sum(float(x[1]) for x in data["bids"])
         asks = sum(float(x[1]) for x in data["asks"])
         return bids, asks
     except Exception:
+        if strict:
+            raise
         return None, None
 
 # --- TEKNİK ANALİZ GÖSTERGELERİ (EMA, MACD, RSI, ATR vs.) ---
-np.seterr(divide='ignore', invalid='ignore')
+# np.seterr(divide='ignore', invalid='ignore') numpy ilk yüklendiğinde uygulanır
 
 def ema(arr, n):
     arr = np.array(arr)
@@ -501,6 +1217,160 @@ def trend_strength_text(trend, adx_val):
     else:
         return f"{trend}, güçlü trend (ADX {adx_val:.2f})"
 
+# --- DESTEK/DİRENÇ VE HACİM PROFİLİ ---
+def volume_profile(close, volume, bins=100, price_range=None):
+    close = np.asarray(close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    return np.histogram(close, bins=bins, range=price_range, weights=volume)
+
+def swing_pivots(high, low, window=5):
+    # i. mum, [i-window, i+window] aralığının tepesi/dibi ise pivot sayılır
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    span = 2 * window + 1
+    if len(high) < span:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    hw = np.lib.stride_tricks.sliding_window_view(high, span)
+    lw = np.lib.stride_tricks.sliding_window_view(low, span)
+    center_h = hw[:, window]
+    center_l = lw[:, window]
+    is_high = (center_h >= hw.max(axis=1)) & (center_h > hw[:, :window].max(axis=1))
+    is_low = (center_l <= lw.min(axis=1)) & (center_l < lw[:, :window].min(axis=1))
+    return np.flatnonzero(is_high) + window, np.flatnonzero(is_low) + window
+
+def volume_nodes(counts, edges):
+    # Hacim histogramındaki yerel tepeler (yüksek hacim düğümleri)
+    counts = np.asarray(counts, dtype=float)
+    centers = (edges[:-1] + edges[1:]) / 2
+    if len(counts) < 3:
+        return centers, counts
+    padded = np.concatenate([[-np.inf], counts, [-np.inf]])
+    peak = (counts > padded[:-2]) & (counts >= padded[2:]) & (counts > counts.mean())
+    return centers[peak], counts[peak]
+
+def cluster_levels(prices, weights=None, tolerance=0.004):
+    prices = np.asarray(prices, dtype=float)
+    if len(prices) == 0:
+        return np.array([]), np.array([])
+    weights = np.ones_like(prices) if weights is None else np.asarray(weights, dtype=float)
+    # Logaritmik fiyat ızgarası: zincirleme birleşme olmadan yakın seviyeler aynı kovaya düşer
+    buckets = np.round(np.log(prices) / np.log1p(tolerance)).astype(np.int64)
+    _, labels = np.unique(buckets, return_inverse=True)
+    strength = np.bincount(labels, weights=weights)
+    levels = np.bincount(labels, weights=weights * prices) / strength
+    return levels, strength
+
+class LevelsEngine:
+    """Sembol/aralık başına hacim profili ve pivotları önbellekte tutar, kapanan mumlarla artımlı günceller"""
+
+    def __init__(self, bins=100, pivot_window=5, tolerance=0.004, max_bars=5000, history=None):
+        self.bins = bins
+        self.pivot_window = pivot_window
+        self.tolerance = tolerance
+        self.max_bars = max_bars
+        self.history = history
+        self._state = {}
+
+    def _seed(self, symbol, interval, closed, closed_ts):
+        # Yerel arşiv canlı mumlarla örtüşüyor veya bitişikse daha derin geçmişle başlanır; yoksa sadece canlı mumlar
+        stored = self.history(symbol, interval) if self.history else None
+        if stored is None or not len(stored["ts"]):
+            return closed
+        step = closed_ts[1] - closed_ts[0] if len(closed_ts) > 1 else 0
+        if stored["ts"][-1] < closed_ts[0] - step:
+            return closed
+        older = stored["ts"] < closed_ts[0]
+        return {k: np.concatenate([np.asarray(stored[k], dtype=float)[older], v]) for k, v in closed.items()}
+
+    def _rebuild(self, st):
+        lo, hi = st["low"].min(), st["high"].max()
+        pad = (hi - lo) * 0.1 or hi * 0.01
+        st["counts"], st["edges"] = volume_profile(st["close"], st["volume"], self.bins, (lo - pad, hi + pad))
+        ph, pl = swing_pivots(st["high"], st["low"], self.pivot_window)
+        st["pivot_high"] = ph + st["offset"]
+        st["pivot_low"] = pl + st["offset"]
+        st["scanned"] = st["offset"] + len(st["close"]) - self.pivot_window
+
+    def _append(self, st, bars):
+        for k in ("high", "low", "close", "volume"):
+            st[k] = np.concatenate([st[k], bars[k]])
+        edges = st["edges"]
+        if bars["close"].min() < edges[0] or bars["close"].max() > edges[-1]:
+            self._trim(st)
+            self._rebuild(st)
+            return
+        st["counts"] = st["counts"] + np.histogram(bars["close"], bins=edges, weights=bars["volume"])[0]
+        # Sadece yeni onaylanabilecek pivotlar taranır
+        w = self.pivot_window
+        start = max(st["scanned"] - w - st["offset"], 0)
+        ph, pl = swing_pivots(st["high"][start:], st["low"][start:], w)
+        base = st["offset"] + start
+        st["pivot_high"] = np.union1d(st["pivot_high"], ph + base)
+        st["pivot_low"] = np.union1d(st["pivot_low"], pl + base)
+        st["scanned"] = st["offset"] + len(st["close"]) - w
+        self._trim(st)
+
+    def _trim(self, st):
+        extra = len(st["close"]) - self.max_bars
+        if extra <= 0:
+            return
+        if "edges" in st:
+            dropped = np.histogram(st["close"][:extra], bins=st["edges"], weights=st["volume"][:extra])[0]
+            st["counts"] = np.maximum(st["counts"] - dropped, 0)
+        for k in ("high", "low", "close", "volume"):
+            st[k] = st[k][extra:]
+        st["offset"] += extra
+        if "pivot_high" in st:
+            st["pivot_high"] = st["pivot_high"][st["pivot_high"] >= st["offset"]]
+            st["pivot_low"] = st["pivot_low"][st["pivot_low"] >= st["offset"]]
+
+    def update(self, symbol, interval, ohlcv):
+        ts = np.asarray(ohlcv["ts"], dtype=np.int64)
+        if len(ts) < 2:
+            return None
+        # Son mum henüz kapanmadı; profile sadece kapanmış mumlar girer
+        closed = {k: np.asarray(ohlcv[k][:-1], dtype=float) for k in ("high", "low", "close", "volume")}
+        closed_ts = ts[:-1]
+        key = (symbol, interval)
+        st = self._state.get(key)
+        if st is None or closed_ts[0] > st["last_ts"]:
+            bars = self._seed(symbol, interval, closed, closed_ts) if st is None else closed
+            st = dict(bars, offset=0, last_ts=int(closed_ts[-1]))
+            self._trim(st)
+            self._rebuild(st)
+            self._state[key] = st
+        else:
+            new = closed_ts > st["last_ts"]
+            if new.any():
+                self._append(st, {k: v[new] for k, v in closed.items()})
+                st["last_ts"] = int(closed_ts[-1])
+        return self.levels(symbol, interval, float(ohlcv["close"][-1]))
+
+    def levels(self, symbol, interval, price):
+        st = self._state.get((symbol, interval))
+        if st is None:
+            return None
+        node_prices, node_vols = volume_nodes(st["counts"], st["edges"])
+        ph = st["high"][st["pivot_high"] - st["offset"]]
+        pl = st["low"][st["pivot_low"] - st["offset"]]
+        node_w = node_vols / node_vols.mean() if len(node_vols) else node_vols
+        levels, strength = cluster_levels(
+            np.concatenate([ph, pl, node_prices]),
+            np.concatenate([np.ones(len(ph) + len(pl)), node_w]),
+            self.tolerance)
+        below = levels < price
+        sup_order = np.argsort(-levels[below])
+        res_order = np.argsort(levels[~below])
+        centers = (st["edges"][:-1] + st["edges"][1:]) / 2
+        return {
+            "supports": list(zip(levels[below][sup_order], strength[below][sup_order])),
+            "resistances": list(zip(levels[~below][res_order], strength[~below][res_order])),
+            "poc": float(centers[np.argmax(st["counts"])]),
+            "bars": len(st["close"])
+        }
+
+LEVELS_ENGINE = LevelsEngine(history=lambda symbol, interval: load_klines(symbol, interval))
+
 def btc_kisavadeli_analizler(ohlcv_dict, current_price, dtstr_tr, dtstr_utc):
     results = []
     vadeler = [
@@ -580,16 +1450,13 @@ def btc_kisavadeli_analizler(ohlcv_dict, current_price, dtstr_tr, dtstr_utc):
                 signal = "🔴"
                 strength = "SAT"
         results.append(
-            f"📉 {vade} Analiz: {signal} {strength} | EMA7/21: {'Pozitif' if trend == 'Pozitif' else 'Negatif' if trend == 'Negatif' else 'Veri yok'} | MACD: {'Pozitif' if macd_line is not None and macd_line > 0 else 'Negatif' if macd_line is not None and macd_line < 0 else 'Veri yok'} | RSI: {rsi_val:.2f if rsi_val is not None else 'Yok'} | Volatilite: {vol_txt}"
+            f"📉 {vade} Analiz: {signal} {strength} | EMA7/21: {'Pozitif' if trend == 'Pozitif' else 'Negatif' if trend == 'Negatif' else 'Veri yok'} | MACD: {'Pozitif' if macd_line is not None and macd_line > 0 else 'Negatif' if macd_line is not None and macd_line < 0 else 'Veri yok'} | RSI: {f'{rsi_val:.2f}' if rsi_val is not None else 'Yok'} | Volatilite: {vol_txt}"
         )
         if vade == "5dk":
             results.append(
                 "⚠️ 5dk'lık analizlerde volatilite ve ATR genellikle düşüktür, ani hareketler yanıltıcı olabilir.")
     return "━━ Kısa Vadeli BTC Analizleri ━━\n" + "\n".join(results) + "\n\n"
-def get_spot_ohlcv(symbol="BTCUSDT", interval="1h", limit=200):
-    url = f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval={interval}&limit={limit}"
-    r = requests.get(url, timeout=10)
-    data = r.json()
+def parse_klines(data):
     ohlcv = {
         "open": [],
         "high": [],
@@ -598,6 +1465,8 @@ def get_spot_ohlcv(symbol="BTCUSDT", interval="1h", limit=200):
         "volume": [],
         "ts": []
     }
+    if not isinstance(data, list):
+        return ohlcv
     for kline in data:
         try:
             ohlcv["open"].append(float(kline[1]))
@@ -610,67 +1479,29 @@ def get_spot_ohlcv(symbol="BTCUSDT", interval="1h", limit=200):
             continue  # Bozuk/hatalı satırı atla
     return ohlcv
 
-def btc_teknik_analiz_raporu(
-    ohlcv,
-    current_price,
-    dtstr_tr,
-    dtstr_utc,
-    balina_net_1h,
-    ls_ratio_1h,
-    vade="1 Saatlik Analiz"
-):
-    close = np.array(ohlcv['close'])
-    high = np.array(ohlcv['high'])
-    low = np.array(ohlcv['low'])
-    volume = np.array(ohlcv['volume'])
-
-    ema7_arr = ema(close, 7)
-    ema21_arr = ema(close, 21)
-    ema7 = ema7_arr[-1] if isinstance(ema7_arr, np.ndarray) else None
-    ema21 = ema21_arr[-1] if isinstance(ema21_arr, np.ndarray) else None
-
-    macd_out = macd(close, 12, 26, 9)
-    macd_line = macd_out[0][-1] if isinstance(macd_out[0], np.ndarray) else None
-
-    rsi_arr = rsi(close, 14)
-    rsi_val = rsi_arr[-1] if isinstance(rsi_arr, np.ndarray) else None
-
-    stochrsi_arr = stoch_rsi(close, 14)
-    stochrsi_val = stochrsi_arr[-1] if isinstance(stochrsi_arr, np.ndarray) else None
-
-    mfi_arr = mfi(high, low, close, volume, 14)
-    mfi_val = mfi_arr[-1] if isinstance(mfi_arr, np.ndarray) else None
-
-    adx_arr = adx(high, low, close, 14)
-    adx_val = adx_arr[-1] if isinstance(adx_arr, np.ndarray) else None
-
-    obv_arr = obv(close, volume)
-    obv_val = obv_arr[-1] if isinstance(obv_arr, np.ndarray) else None
-    obv_prev = obv_arr[-2] if (isinstance(obv_arr, np.ndarray) and len(obv_arr) > 1) else None
-    obv_1h_pct = (100 * (obv_val - obv_prev) / abs(obv_prev)) if (
-        obv_val is not None and obv_prev is not None and abs(obv_prev) > 0) else None
-
-    boll_ma, boll_up, boll_down = bollinger(close, 20, 2)
-    atr_arr = atr(high, low, close, 14)
-    atr_now = atr_arr[-1] if isinstance(atr_arr, np.ndarray) else None
-    volatility_txt = volatility_level(atr_now, close[-1] if len(close) else None)
+def get_spot_ohlcv(symbol="BTCUSDT", interval="1h", limit=200, strict=False):
+    # strict: zamanlayıcı kaynakları hatayı görsün, önbellekteki son iyi değer korunsun
+    url = f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval={interval}&limit={limit}"
+    try:
+        data = http_request("GET", url, "binance_spot", max_retry=2).json()
+    except Exception as e:
+        if strict:
+            raise
+        print(f"{symbol} {interval} mum verisi alınamadı: {e}")
+        return parse_klines([])
+    return parse_klines(data)
 
-    trend = None
-    if ema7 is not None and ema21 is not None:
-        if ema7 > ema21:
-            trend = "YUKARI"
-        elif ema7 < ema21:
-            trend = "AŞAĞI"
-    trend_guc_txt = trend_strength_text(trend or "N/A", adx_val)
-    trend_guc_score = None
-    if adx_val is not None:
-        if adx_val < 20:
-            trend_guc_score = 0
-        elif adx_val < 25:
-            trend_guc_score = 1
-        else:
-            trend_guc_score = 2
+def trend_strength_score(adx_val):
+    if adx_val is None:
+        return None
+    if adx_val < 20:
+        return 0
+    elif adx_val < 25:
+        return 1
+    return 2
 
+def technical_score(ema7, ema21, macd_line, rsi_val, mfi_val, adx_val, obv_val,
+                    atr_now, volatility_txt, trend_guc_score, balina_net_1h, ls_ratio_1h, derivatives=None):
     score = 0
     max_score = 0
     missing = []
@@ -751,41 +1582,121 @@ def btc_teknik_analiz_raporu(
     elif ls_ratio_1h < 0.90:
         score -= 1
 
-    if max_score == 0:
-        signal_strength = "Veri Yok"
-        signal = "⚪️ TUT (Veri Yok)"
-    else:
-        ratio = score / max_score
-        if ratio >= 0.85:
-            signal_strength = "ÇOK GÜÇLÜ"
-        elif ratio >= 0.6:
-            signal_strength = "ORTA"
-        elif ratio >= 0.3:
-            signal_strength = "ZAYIF"
-        else:
-            signal_strength = "TEREDDÜTLÜ"
-        if score <= -3:
-            signal = f"🔴 SAT ({signal_strength})"
-        elif score >= 5:
-            signal = f"🟢 AL ({signal_strength})"
-        elif score >= 1:
-            signal = f"🟡 TUT/AL ({signal_strength})"
-        elif score <= -1:
-            signal = f"🟡 TUT/SAT ({signal_strength})"
-        else:
-            signal = f"⚪️ TUT ({signal_strength})"
+    derivatives = derivatives or {}
+    funding_pct = derivatives.get("funding_pct")
+    if funding_pct is not None:
+        # Aşırı pozitif fonlama kalabalık long demektir; ters yönde puanlanır
+        max_score += 1
+        if funding_pct >= FUNDING_EXTREME_PCT:
+            score -= 1
+        elif funding_pct <= 100 - FUNDING_EXTREME_PCT:
+            score += 1
+    if derivatives.get("oi_change") is not None:
+        # Fiyat hareketi yeni pozisyonlarla destekleniyorsa yönü teyit eder
+        max_score += 1
+        if derivatives["oi_change"] > 0:
+            score += 1 if derivatives["price_change"] > 0 else -1
+    return score, max_score, missing
 
-    destek = min(close[-20:]) if len(close) >= 20 else min(close)
-    direnç = max(close[-20:]) if len(close) >= 20 else max(close)
+def btc_teknik_analiz_raporu(
+    ohlcv,
+    current_price,
+    dtstr_tr,
+    dtstr_utc,
+    balina_net_1h,
+    ls_ratio_1h,
+    vade="1 Saatlik Analiz",
+    levels=None,
+    derivatives=None
+):
+    close = np.array(ohlcv['close'])
+    high = np.array(ohlcv['high'])
+    low = np.array(ohlcv['low'])
+    volume = np.array(ohlcv['volume'])
 
-    balina_etiket = "Pozitif (Borsadan çıkış)" if balina_net_1h < 0 else "Negatif (Borsaya giriş)"
-    ls_etiket = "Pozitif (Longlar baskın)" if ls_ratio_1h > 1.05 else "Negatif (Shortlar baskın)"
+    ema7_arr = ema(close, 7)
+    ema21_arr = ema(close, 21)
+    ema7 = ema7_arr[-1] if isinstance(ema7_arr, np.ndarray) else None
+    ema21 = ema21_arr[-1] if isinstance(ema21_arr, np.ndarray) else None
 
-    ek_veriler = (
-        f"\n📊 Ek Veriler ({vade})\n"
-        f"• Balina Net Akışı: {balina_net_1h:.2f} BTC ({balina_etiket})\n"
-        f"• Long/Short Oranı: {ls_ratio_1h:.2f} ({ls_etiket})\n"
-        f"• OBV değişim (1h): {obv_1h_pct:+.2f}%" if obv_1h_pct is not None else "• OBV değişim (1h): Veri yok"
+    macd_out = macd(close, 12, 26, 9)
+    macd_line = macd_out[0][-1] if isinstance(macd_out[0], np.ndarray) else None
+
+    rsi_arr = rsi(close, 14)
+    rsi_val = rsi_arr[-1] if isinstance(rsi_arr, np.ndarray) else None
+
+    stochrsi_arr = stoch_rsi(close, 14)
+    stochrsi_val = stochrsi_arr[-1] if isinstance(stochrsi_arr, np.ndarray) else None
+
+    mfi_arr = mfi(high, low, close, volume, 14)
+    mfi_val = mfi_arr[-1] if isinstance(mfi_arr, np.ndarray) else None
+
+    adx_arr = adx(high, low, close, 14)
+    adx_val = adx_arr[-1] if isinstance(adx_arr, np.ndarray) else None
+
+    obv_arr = obv(close, volume)
+    obv_val = obv_arr[-1] if isinstance(obv_arr, np.ndarray) else None
+    obv_prev = obv_arr[-2] if (isinstance(obv_arr, np.ndarray) and len(obv_arr) > 1) else None
+    obv_1h_pct = (100 * (obv_val - obv_prev) / abs(obv_prev)) if (
+        obv_val is not None and obv_prev is not None and abs(obv_prev) > 0) else None
+
+    boll_ma, boll_up, boll_down = bollinger(close, 20, 2)
+    atr_arr = atr(high, low, close, 14)
+    atr_now = atr_arr[-1] if isinstance(atr_arr, np.ndarray) else None
+    volatility_txt = volatility_level(atr_now, close[-1] if len(close) else None)
+
+    trend = None
+    if ema7 is not None and ema21 is not None:
+        if ema7 > ema21:
+            trend = "YUKARI"
+        elif ema7 < ema21:
+            trend = "AŞAĞI"
+    trend_guc_txt = trend_strength_text(trend or "N/A", adx_val)
+    trend_guc_score = trend_strength_score(adx_val)
+
+    score, max_score, missing = technical_score(
+        ema7, ema21, macd_line, rsi_val, mfi_val, adx_val, obv_val,
+        atr_now, volatility_txt, trend_guc_score, balina_net_1h, ls_ratio_1h, derivatives)
+
+    if max_score == 0:
+        signal_strength = "Veri Yok"
+        signal = "⚪️ TUT (Veri Yok)"
+    else:
+        ratio = score / max_score
+        if ratio >= 0.85:
+            signal_strength = "ÇOK GÜÇLÜ"
+        elif ratio >= 0.6:
+            signal_strength = "ORTA"
+        elif ratio >= 0.3:
+            signal_strength = "ZAYIF"
+        else:
+            signal_strength = "TEREDDÜTLÜ"
+        if score <= -3:
+            signal = f"🔴 SAT ({signal_strength})"
+        elif score >= 5:
+            signal = f"🟢 AL ({signal_strength})"
+        elif score >= 1:
+            signal = f"🟡 TUT/AL ({signal_strength})"
+        elif score <= -1:
+            signal = f"🟡 TUT/SAT ({signal_strength})"
+        else:
+            signal = f"⚪️ TUT ({signal_strength})"
+
+    destek = min(close[-20:]) if len(close) >= 20 else min(close)
+    direnç = max(close[-20:]) if len(close) >= 20 else max(close)
+    if levels and levels["supports"]:
+        destek = levels["supports"][0][0]
+    if levels and levels["resistances"]:
+        direnç = levels["resistances"][0][0]
+
+    balina_etiket = "Pozitif (Borsadan çıkış)" if balina_net_1h < 0 else "Negatif (Borsaya giriş)"
+    ls_etiket = "Pozitif (Longlar baskın)" if ls_ratio_1h > 1.05 else "Negatif (Shortlar baskın)"
+
+    ek_veriler = (
+        f"\n📊 Ek Veriler ({vade})\n"
+        f"• Balina Net Akışı: {balina_net_1h:.2f} BTC ({balina_etiket})\n"
+        f"• Long/Short Oranı: {ls_ratio_1h:.2f} ({ls_etiket})\n"
+        f"• OBV değişim (1h): {obv_1h_pct:+.2f}%" if obv_1h_pct is not None else "• OBV değişim (1h): Veri yok"
         + f"\n• {trend_guc_txt}"
         + f"\n• Volatilite: {volatility_txt}"
     )
@@ -830,6 +1741,13 @@ def btc_teknik_analiz_raporu(
     rapor.append(f"• Trend filtresi: {trend_guc_txt}")
     rapor.append(f"• Volatilite: {volatility_txt}")
     rapor.append(f"• Destek: ${destek:,.2f} | Direnç: ${direnç:,.2f}")
+    if levels:
+        rapor.append(f"• Hacim profili POC: ${levels['poc']:,.2f}")
+    if derivatives and derivatives.get("oi_change") is not None:
+        rapor.append(
+            f"• Açık Pozisyon: {derivatives['oi_change']:+.2f}% | Fiyat: {derivatives['price_change']:+.2f}% → {derivatives['oi_regime']}")
+    if derivatives and derivatives.get("funding_pct") is not None:
+        rapor.append(f"• Fonlama yüzdeliği ({DERIVATIVES_DAYS} gün): %{derivatives['funding_pct']:.0f}")
     rapor.append(ek_veriler)
     if missing:
         rapor.append(
@@ -838,10 +1756,24 @@ def btc_teknik_analiz_raporu(
     return "\n".join(
         rapor
     ), score, max_score, destek, direnç, ema7, ema21, macd_line, rsi_val, obv_val, trend, obv_1h_pct
+def get_funding_rate(symbol="BTCUSDT"):
+    url = f"https://fapi.binance.com/fapi/v1/premiumIndex?symbol={symbol}"
+    try:
+        return float(http_request("GET", url, "binance_futures").json()["lastFundingRate"])
+    except Exception:
+        return None
+
+def get_open_interest(symbol="BTCUSDT"):
+    url = f"https://fapi.binance.com/fapi/v1/openInterest?symbol={symbol}"
+    try:
+        return float(http_request("GET", url, "binance_futures").json()["openInterest"])
+    except Exception:
+        return None
+
 def get_long_short_ratio(symbol="BTCUSDT", period="5m"):
     url = f"https://fapi.binance.com/futures/data/globalLongShortAccountRatio?symbol={symbol}&period={period}&limit=1"
     try:
-        result = requests.get(url, timeout=10).json()
+        result = http_request("GET", url, "binance_futures").json()
         ratio = float(result[0]['longShortRatio'])
         return ratio
     except Exception:
@@ -850,7 +1782,7 @@ def get_long_short_ratio(symbol="BTCUSDT", period="5m"):
 def get_spot_volume(symbol="BTCUSDT", interval="5m", count=1):
     url = f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval={interval}&limit={count}"
     try:
-        data = requests.get(url, timeout=10).json()
+        data = http_request("GET", url, "binance_spot").json()
         total = sum(float(x[5]) for x in data)
         return total
     except Exception:
@@ -859,34 +1791,66 @@ def get_spot_volume(symbol="BTCUSDT", interval="5m", count=1):
 def get_futures_volume(symbol="BTCUSDT", interval="5m", count=1):
     url = f"https://fapi.binance.com/fapi/v1/klines?symbol={symbol}&interval={interval}&limit={count}"
     try:
-        data = requests.get(url, timeout=10).json()
+        data = http_request("GET", url, "binance_futures").json()
         total = sum(float(x[7]) for x in data)
         return total
     except Exception:
         return None
 
-def btc_piyasa_analiz_turkce():
-    intervals = [
-        ("5m", "Son 5 Dakika"),
-        ("30m", "Son 30 Dakika"),
-        ("1h", "Son 1 Saat"),
-        ("4h", "Son 4 Saat"),
-        ("1d", "Son 24 Saat")
-    ]
+MARKET_INTERVALS = [
+    ("5m", "Son 5 Dakika"),
+    ("30m", "Son 30 Dakika"),
+    ("1h", "Son 1 Saat"),
+    ("4h", "Son 4 Saat"),
+    ("1d", "Son 24 Saat")
+]
+
+MARKET_VALUE_KEYS = ("funding_rate", "ls_ratio", "open_interest", "spot_volume", "futures_volume")
+
+def collect_market_snapshot(strict=False):
+    # Emir derinliği ayrı ve daha sık yenilendiği için burada çekilmiyor
+    # Fonlama ve açık pozisyon dilimden bağımsız; bir kez çekilir
+    snapshot = {}
+    funding_rate = get_funding_rate()
+    open_interest = get_open_interest()
+    refresh_derivatives("BTCUSDT", max_pages=DERIVATIVES_REPORT_PAGES)
+    derived = derivatives_metrics("BTCUSDT", current_funding=funding_rate)
+    for interval, label in MARKET_INTERVALS:
+        snapshot[interval] = {
+            "label": label,
+            "funding_rate": funding_rate,
+            "ls_ratio": get_long_short_ratio(period=interval),
+            "open_interest": open_interest,
+            "spot_volume": get_spot_volume(interval=interval, count=1),
+            "futures_volume": get_futures_volume(interval=interval, count=1)
+        }
+        snapshot[interval].update(derived.get(interval, {}))
+    if strict and all(row[k] is None for row in snapshot.values() for k in MARKET_VALUE_KEYS):
+        raise SourceUnavailable("Piyasa verilerinin hiçbiri alınamadı")
+    return snapshot
+
+def format_market_report(snapshot, depth=(None, None)):
+    bids, asks = depth if depth else (None, None)
     out = "━━ BTC Piyasa Verileri ━━\n"
-    for interval, label in intervals:
-        funding_rate = get_funding_rate()
-        ratio = get_long_short_ratio(period=interval)
-        open_interest = get_open_interest()
-        spot_vol = get_spot_volume(interval=interval, count=1)
-        futures_vol = get_futures_volume(interval=interval, count=1)
-        bids, asks = get_order_book_depth(limit=20)
+    has_rows = False
+    for interval, label in MARKET_INTERVALS:
+        row = snapshot.get(interval, {})
+        funding_rate = row.get("funding_rate")
+        ratio = row.get("ls_ratio")
+        open_interest = row.get("open_interest")
+        spot_vol = row.get("spot_volume")
+        futures_vol = row.get("futures_volume")
         any_data = False
         lines = [f"\n📅 {label}"]
         if funding_rate is not None:
             lines.append(
                 f"• Fonlama Oranı: {funding_rate:.5f} ({'Pozitif' if funding_rate > 0 else 'Negatif'})\n  (Vadeli işlem fonlama oranı. Negatif ise short pozisyonlar daha baskın.)")
             any_data = True
+            # Yüzdelik satırı fonlama satırının devamıdır; oran yoksa tek başına yazılmaz
+            funding_pct = row.get("funding_pct")
+            if funding_pct is not None:
+                asiri = funding_pct >= FUNDING_EXTREME_PCT or funding_pct <= 100 - FUNDING_EXTREME_PCT
+                lines.append(f"  Son {DERIVATIVES_DAYS} günün %{funding_pct:.0f}. yüzdeliği{' (aşırı seviye)' if asiri else ''}")
         if ratio is not None:
             lines.append(
                 f"• Uzun/Kısa Oranı: {ratio:.2f} (1'in altı short ağırlık demektir.)")
@@ -895,11 +1859,15 @@ def btc_piyasa_analiz_turkce():
             lines.append(
                 f"• Açık Pozisyon: {open_interest:,.0f} BTC (Piyasadaki toplam açık kontrat miktarı.)")
             any_data = True
+        if row.get("oi_change") is not None:
+            lines.append(
+                f"• Açık Pozisyon Değişimi: {row['oi_change']:+.2f}% | Fiyat: {row['price_change']:+.2f}% → {row['oi_regime']}")
+            any_data = True
         if spot_vol is not None:
-            lines.append(f"• Spot İşlem Hacmi: {spot_vol:,.2f} BTC")
+            lines.append(f"• Spot İşlem Hacmi: {spot_vol:,.2f} BTC{z_etiketi(row.get('spot_volume_z'))}")
             any_data = True
         if futures_vol is not None:
-            lines.append(f"• Vadeli İşlem Hacmi: {futures_vol:,.2f} USD")
+            lines.append(f"• Vadeli İşlem Hacmi: {futures_vol:,.2f} USD{z_etiketi(row.get('futures_volume_z'))}")
             any_data = True
         if bids is not None and asks is not None:
             lines.append(
@@ -907,9 +1875,16 @@ def btc_piyasa_analiz_turkce():
             any_data = True
         if any_data:
             out += "\n".join(lines) + "\n"
+            has_rows = True
+    if not has_rows:
+        out += "Veri yok\n"
     return out
 
-def nihai_oneri(skor_5m, skor_15m, skor_30m, skor_1h, skor_4h,
+def btc_piyasa_analiz_turkce():
+    snapshot = annotate_market_anomalies(collect_market_snapshot(), datetime.now(timezone.utc))
+    return format_market_report(snapshot, get_order_book_depth(limit=20))
+
+def nihai_karar(skor_5m, skor_15m, skor_30m, skor_1h, skor_4h,
                 skor_1d, trend_1h, trend_4h, trend_1d):
     karar = "TUT"
     simge = "🟡"
@@ -931,7 +1906,15 @@ def nihai_oneri(skor_5m, skor_15m, skor_30m, skor_1h, skor_4h,
         karar = "TUT"
         simge = "🟡"
         gerekce = "Kısa ve uzun vade arasında kararsızlık var, acele etme."
-    return f"\n📢 Nihai Öneri: {simge} {karar}\nGerekçe: {gerekce}\n"
+    return {"karar": karar, "simge": simge, "gerekce": gerekce}
+
+def format_nihai_oneri(sonuc):
+    return f"\n📢 Nihai Öneri: {sonuc['simge']} {sonuc['karar']}\nGerekçe: {sonuc['gerekce']}\n"
+
+def nihai_oneri(skor_5m, skor_15m, skor_30m, skor_1h, skor_4h,
+                skor_1d, trend_1h, trend_4h, trend_1d):
+    return format_nihai_oneri(nihai_karar(
+        skor_5m, skor_15m, skor_30m, skor_1h, skor_4h, skor_1d, trend_1h, trend_4h, trend_1d))
 
 def generate_dynamic_comment(rsi_val, macd_val, obv_pct):
     """Dinamik yorum üretir (RSI, MACD, OBV'ye göre)"""
@@ -951,6 +1934,7 @@ def generate_dynamic_comment(rsi_val, macd_val, obv_pct):
     return ". ".join(comments) + "." if comments else "Belirgin sinyal yok."
 
 def plot_technical_indicators(ohlcv):
+    import matplotlib.pyplot as plt
     plt.style.use('dark_background')
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 8))
     closes = ohlcv['close'][-100:]
@@ -987,35 +1971,440 @@ def backtest_strategy(ohlcv_data, lookback=50):
         signals.append(1 if buy_condition else (-1 if sell_condition else 0))
     return signals
 
-async def main():
-    # Telegram bağlantısı ve mesaj çekme
-    client = TelegramClient('anon', api_id, api_hash)
-    await client.start()
-    print("Telegram'a bağlanıldı.")
+# --- ÇAPRAZ VARLIK KORELASYON VE BETA ---
+CORRELATION_WINDOWS = (24, 72, 168)
+STABLECOINS = {"USDT", "USDC", "DAI"}
 
-    now = datetime.now(timezone.utc)
-    now_tr = (now + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M')
-    now_utc = now.strftime('%Y-%m-%d %H:%M')
+def binance_symbol(coin):
+    # Sabit coinin USDT paritesi yok; korelasyona katılmaz
+    return None if coin in STABLECOINS else f"{coin}USDT"
+
+class RollingCoMoments:
+    """Kayan pencerede toplam ve çapraz çarpım matrisini tutar; her yeni satır O(N^2)"""
 
-    # Whale Alert kanalından son 150 mesajı çek
+    def __init__(self, n_assets, window):
+        self.window = window
+        self.buf = np.zeros((window, n_assets))
+        self.pos = 0
+        self.count = 0
+        self.sum = np.zeros(n_assets)
+        self.cross = np.zeros((n_assets, n_assets))
+        self._since_resync = 0
+
+    def push(self, row):
+        row = np.asarray(row, dtype=float)
+        if self.count == self.window:
+            old = self.buf[self.pos]
+            self.sum -= old
+            self.cross -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.buf[self.pos] = row
+        self.sum += row
+        self.cross += np.outer(row, row)
+        self.pos = (self.pos + 1) % self.window
+        self._since_resync += 1
+        if self._since_resync >= self.window * 10:
+            # Ekle/çıkar birikimli yuvarlama hatasını sıfırlar
+            data = self.buf[:self.count]
+            self.sum = data.sum(axis=0)
+            self.cross = data.T @ data
+            self._since_resync = 0
+
+    def covariance(self):
+        if self.count < 2:
+            return None
+        mean = self.sum / self.count
+        return (self.cross - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+    def correlation(self):
+        cov = self.covariance()
+        if cov is None:
+            return None
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.outer(std, std)
+        return np.nan_to_num(corr)
+
+    def beta(self, ref):
+        cov = self.covariance()
+        if cov is None or cov[ref, ref] <= 0:
+            return None
+        return cov[:, ref] / cov[ref, ref]
+
+class CorrelationTracker:
+    """Coinlerin getiri serilerini zaman damgasına göre hizalar, çoklu pencerede korelasyon/beta tutar"""
+
+    def __init__(self, coins, windows=CORRELATION_WINDOWS, ref="BTC"):
+        self.coins = [c for c in coins if binance_symbol(c)]
+        self.index = {c: i for i, c in enumerate(self.coins)}
+        self.ref = ref
+        self.moments = {w: RollingCoMoments(len(self.coins), w) for w in windows}
+        self.last_ts = None
+        self.last_close = np.full(len(self.coins), np.nan)
+
+    def update(self, ohlcv_by_coin):
+        # Kapanmış mumların ortak zaman ekseni; eksik coin için son fiyat taşınır (getiri 0)
+        series = {}
+        for coin in self.coins:
+            ohlcv = ohlcv_by_coin.get(coin)
+            if ohlcv and len(ohlcv["ts"]) > 1:
+                series[coin] = (np.asarray(ohlcv["ts"][:-1], dtype=np.int64), np.asarray(ohlcv["close"][:-1], dtype=float))
+        if not series:
+            return 0
+        ts = np.unique(np.concatenate([t for t, _ in series.values()]))
+        if self.last_ts is not None:
+            ts = ts[ts > self.last_ts]
+        if len(ts) == 0:
+            return 0
+        prices = np.full((len(ts), len(self.coins)), np.nan)
+        for coin, (t, c) in series.items():
+            pos = np.searchsorted(t, ts)
+            hit = (pos < len(t)) & (t[np.minimum(pos, len(t) - 1)] == ts)
+            prices[hit, self.index[coin]] = c[pos[hit]]
+        # İlk çağrıda önceki kapanış yok: ilk satır sadece taban olur, sahte sıfır getiri satırı eklenmez
+        if not np.isnan(self.last_close).all():
+            prices = np.vstack([self.last_close, prices])
+        # İleri doldurma: NaN olan hücre bir önceki satırdaki fiyatı alır
+        idx = np.where(np.isnan(prices), 0, np.arange(len(prices))[:, None])
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        prices = prices[idx, np.arange(prices.shape[1])]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.nan_to_num(np.diff(np.log(prices), axis=0))
+        for row in returns:
+            for m in self.moments.values():
+                m.push(row)
+        self.last_ts = int(ts[-1])
+        self.last_close = prices[-1]
+        return len(returns)
+
+    def snapshot(self):
+        ref = self.index.get(self.ref)
+        out = {}
+        for w, m in self.moments.items():
+            corr = m.correlation()
+            if corr is None:
+                continue
+            beta = m.beta(ref) if ref is not None else None
+            out[w] = {
+                "bars": m.count,
+                "corr": corr,
+                "vs_ref": {
+                    c: {"corr": float(corr[i, ref]) if ref is not None else None,
+                        "beta": float(beta[i]) if beta is not None else None}
+                    for c, i in self.index.items() if c != self.ref
+                },
+                "top_pairs": top_co_movers(corr, self.coins)
+            }
+        return out
+
+def top_co_movers(corr, coins, k=3):
+    iu = np.triu_indices(len(coins), 1)
+    values = corr[iu]
+    order = np.argsort(-np.abs(values))[:k]
+    return [(coins[iu[0][i]], coins[iu[1][i]], float(values[i])) for i in order]
+
+def fetch_universe_ohlcv(interval="1h", limit=200, strict=False):
+    # Tek coinin eksikliği korelasyonu durdurmaz; strict'te hiçbir coin gelmezse hata
+    out = {}
+    for coin in COINGECKO_IDS:
+        symbol = binance_symbol(coin)
+        if symbol:
+            out[coin] = get_spot_ohlcv(symbol, interval, limit)
+    if strict and not any(ohlcv["ts"] for ohlcv in out.values()):
+        raise SourceUnavailable(f"{interval} mum verisi hiçbir coin için alınamadı")
+    return out
+
+def format_correlation_report(snapshot, ref="BTC"):
+    out = [f"━━ 🔗 Korelasyon ve Beta ({ref}'ye göre, 1s getiriler) ━━"]
+    if not snapshot:
+        out.append("Veri yok")
+        return "\n".join(out) + "\n"
+    for w, data in snapshot.items():
+        out.append(f"\n⏱ Son {w} saat ({data['bars']} mum)")
+        for coin, v in data["vs_ref"].items():
+            beta_s = f"{v['beta']:.2f}" if v["beta"] is not None else "-"
+            out.append(f"• {coin}: Korelasyon {v['corr']:+.2f} | Beta {beta_s}")
+        pairs = ", ".join(f"{a}/{b} {c:+.2f}" for a, b, c in data["top_pairs"])
+        out.append(f"  En çok birlikte hareket edenler: {pairs}")
+    return "\n".join(out) + "\n"
+
+_correlation_tracker = None
+
+def get_correlation_tracker():
+    # Süreç boyunca tek izleyici; numpy dizileri ilk kullanımda ayrılır
+    global _correlation_tracker
+    if _correlation_tracker is None:
+        _correlation_tracker = CorrelationTracker(list(COINGECKO_IDS))
+    return _correlation_tracker
+
+def correlation_payload(snapshot):
+    return {str(w): {k: v for k, v in d.items() if k != "corr"} for w, d in snapshot.items()}
+
+# --- AKAN ANOMALİ DEDEKTÖRÜ (EWMA + SAATLİK MEVSİMSELLİK) ---
+ANOMALY_STATE_FILE = "anomaly_state.json"
+ANOMALY_Z_THRESHOLD = 3.0
+ANOMALY_MAX_GAP = 3600
+VOLUME_METRICS = ("spot_volume", "futures_volume")
+
+class SeasonalEwma:
+    """Tek seri için EWMA ortalama/varyans ve 24 saatlik sapma profili; bellek sabit"""
+    __slots__ = ("mean", "var", "season", "n", "last_ts")
+
+    def __init__(self, mean=0.0, var=0.0, season=None, n=0, last_ts=None):
+        self.mean = mean
+        self.var = var
+        self.season = season or [0.0] * 24
+        self.n = n
+        self.last_ts = last_ts
+
+    def score(self, x, hour):
+        if self.n < 2 or self.var <= 0:
+            return None
+        return (x - self.mean - self.season[hour]) / self.var ** 0.5
+
+    def update(self, x, hour, alpha, season_alpha):
+        if self.n == 0:
+            self.mean = x
+        else:
+            resid = x - self.mean - self.season[hour]
+            self.var = (1 - alpha) * (self.var + alpha * resid * resid)
+            self.season[hour] += season_alpha * (x - self.mean - self.season[hour])
+            self.mean += alpha * (x - self.mean)
+        self.n += 1
+
+    def to_list(self):
+        return [self.mean, self.var, self.season, self.n, self.last_ts]
+
+class AnomalyDetector:
+    """(coin, metrik, zaman dilimi) serileri için akan taban çizgisi; her olay O(1)"""
+
+    def __init__(self, alpha=0.05, season_alpha=0.1, z_threshold=ANOMALY_Z_THRESHOLD, warmup=24, state_file=None):
+        self.alpha = alpha
+        self.season_alpha = season_alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.state_file = state_file
+        self.series = {}
+        if state_file and os.path.exists(state_file):
+            try:
+                with open(state_file) as f:
+                    self.series = {k: SeasonalEwma(*v) for k, v in json.load(f).items()}
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Anomali durumu okunamadı, sıfırdan başlanıyor: {e}")
+
+    def update(self, coin, metric, timeframe, value, ts, min_gap=0):
+        # Skor her çağrıda üretilir; taban çizgisi ise en az min_gap saniyede bir güncellenir
+        # ki çakışan pencereler ve aynı verinin tekrar hesaplanması ortalamayı bozmasın
+        key = f"{coin}|{metric}|{timeframe}"
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = SeasonalEwma()
+        hour = int(ts // 3600) % 24
+        z = s.score(value, hour) if s.n >= self.warmup else None
+        if s.last_ts is None or ts - s.last_ts >= min_gap:
+            s.update(value, hour, self.alpha, self.season_alpha)
+            s.last_ts = ts
+        return {"z": z, "anomaly": z is not None and abs(z) >= self.z_threshold}
+
+    def save(self):
+        if not self.state_file:
+            return
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({k: s.to_list() for k, s in self.series.items()}, f)
+        os.replace(tmp, self.state_file)
+
+_anomaly_detector = None
+
+def get_anomaly_detector():
+    global _anomaly_detector
+    if _anomaly_detector is None:
+        _anomaly_detector = AnomalyDetector(state_file=ANOMALY_STATE_FILE)
+    return _anomaly_detector
+
+def whale_flow_zscores(per_coin, now, detector=None):
+    detector = detector or get_anomaly_detector()
+    ts = now.timestamp()
+    zscores = {}
+    for coin, frames in per_coin.items():
+        zscores[coin] = [
+            detector.update(coin, "whale_net", label, data["usd_net_px"], ts,
+                            min_gap=min(minutes * 60, ANOMALY_MAX_GAP))["z"]
+            for (label, data), (_, minutes) in zip(frames, TIME_FRAMES)
+        ]
+    # Tekrar oynatma kayıtlı veriyle gerçek durumu ilerletmesin
+    if TRANSPORT["mode"] != "replay":
+        detector.save()
+    return zscores
+
+def annotate_market_anomalies(snapshot, now, symbol="BTC", detector=None):
+    # Hacimler çarpık dağıldığı için log ölçeğinde izlenir
+    detector = detector or get_anomaly_detector()
+    ts = now.timestamp()
+    for interval, row in snapshot.items():
+        for metric in VOLUME_METRICS:
+            value = row.get(metric)
+            if value is None or value < 0:
+                continue
+            result = detector.update(symbol, metric, interval, float(np.log1p(value)), ts,
+                                     min_gap=min(INTERVAL_MS[interval] / 1000, ANOMALY_MAX_GAP))
+            row[f"{metric}_z"] = result["z"]
+            row[f"{metric}_anomaly"] = result["anomaly"]
+    # Tekrar oynatma kayıtlı veriyle gerçek durumu ilerletmesin
+    if TRANSPORT["mode"] != "replay":
+        detector.save()
+    return snapshot
+
+def z_etiketi(z):
+    if z is None:
+        return ""
+    return f" | z: {z:+.1f}{' ⚠️ olağandışı' if abs(z) >= ANOMALY_Z_THRESHOLD else ''}"
+
+# --- VERİ TOPLAMA YARDIMCILARI ---
+def whale_channels():
+    # WHALE_CHANNELS="whale_alert_io,kanal2:compact" -> [(kanal, ayrıştırıcı adı)]
+    channels = []
+    for item in config("WHALE_CHANNELS", WH_ALERT_CHANNEL).split(","):
+        name, _, parser = item.strip().partition(":")
+        if not name:
+            continue
+        if (parser or "whale_alert") not in WHALE_PARSERS:
+            print(f"{name}: bilinmeyen ayrıştırıcı '{parser}', whale_alert kullanılıyor")
+            parser = ""
+        channels.append((name, parser or "whale_alert"))
+    return channels
+
+class WhaleDedupIndex:
+    """(coin, kaynak, hedef) parmak izlerini zaman kovalarında tutar; miktarlar yazım hassasiyeti toleransıyla eşlenir"""
+
+    def __init__(self, bucket_seconds=300, horizon_minutes=1440, max_entries=50000):
+        self.bucket_seconds = bucket_seconds
+        self.horizon_buckets = horizon_minutes * 60 // bucket_seconds + 1
+        self.max_entries = max_entries
+        self._buckets = {}
+        self._order = []
+        self._size = 0
+        self._newest = None
+
+    @staticmethod
+    def fingerprint(m):
+        # Kanallar arası küçük yazım farkları (#, boşluk) aynı transferi ayırmasın; miktar ayrıca karşılaştırılır
+        norm = lambda acct: re.sub(r'[^a-z0-9]', '', acct)
+        key = f"{m['coin']}|{norm(m['from'])}|{norm(m['to'])}"
+        return hashlib.blake2b(key.encode(), digest_size=8).digest()
+
+    def _bucket(self, date):
+        return int(date.timestamp()) // self.bucket_seconds
+
+    def seen(self, m):
+        fp = self.fingerprint(m)
+        b = self._bucket(m["date"])
+        amount, tol = m["amount"], m.get("amount_tol", 0.0)
+        # Kova sınırına denk gelen yeniden paylaşımlar için komşu kovalara da bakılır.
+        # İki yazımın aralıkları örtüşüyorsa ("1.2K" ±50 ile "1,234" ±0.5) aynı transferdir
+        for k in (b - 1, b, b + 1):
+            for other, other_tol in self._buckets.get(k, {}).get(fp, ()):
+                if abs(amount - other) <= tol + other_tol + 1e-9 * max(amount, other):
+                    return True
+        return False
+
+    def add(self, m):
+        """Transfer yeniyse kaydeder ve True döner, kopyaysa False"""
+        if self.seen(m):
+            return False
+        b = self._bucket(m["date"])
+        if self._newest is not None and b < self._newest - self.horizon_buckets:
+            return False
+        if b not in self._buckets:
+            self._buckets[b] = {}
+            heapq.heappush(self._order, b)
+        self._buckets[b].setdefault(self.fingerprint(m), []).append((m["amount"], m.get("amount_tol", 0.0)))
+        self._size += 1
+        self._newest = b if self._newest is None else max(self._newest, b)
+        self._evict()
+        return True
+
+    def _evict(self):
+        while self._order and (self._order[0] < self._newest - self.horizon_buckets
+                               or self._size > self.max_entries):
+            self._size -= sum(map(len, self._buckets.pop(heapq.heappop(self._order)).values()))
+
+    def __len__(self):
+        return self._size
+
+def _parse_whale_message(msg, parser=parse_whale_alert, channel=WH_ALERT_CHANNEL):
+    parsed = parser(msg.text)
+    if not parsed or parsed["coin"] not in COINGECKO_IDS:
+        return None
+    parsed["date"] = msg.date
+    parsed["id"] = msg.id
+    parsed["channel"] = channel
+    return parsed
+
+async def _fetch_channel(client, channel, parser_name, limit, min_id=0):
+    parser = WHALE_PARSERS[parser_name]
+    last_id = min_id
     messages = []
-    async for msg in client.iter_messages(WH_ALERT_CHANNEL, limit=150):
-        parsed = parse_whale_alert(msg.text)
-        if parsed and parsed["coin"] in COINGECKO_IDS:
-            parsed["date"] = msg.date
+    async for msg in client.iter_messages(channel, limit=limit, min_id=min_id):
+        last_id = max(last_id, msg.id)
+        parsed = _parse_whale_message(msg, parser, channel)
+        if parsed:
             messages.append(parsed)
-    print(f"{len(messages)} adet balina transferi bulundu.")
+    return last_id, messages
 
-    # BTC için analiz ve rapor
-    per_coin, per_coin_xchain = analyze_all_periods(messages, now)
-    gunluk_hacimler = {}
-    gunluk_fiyatlar = {}
-    for coin in COINGECKO_IDS:
-        hacim, err = get_daily_volume_usd(coin)
+async def _fetch_channels(client, channels, limit, last_ids, dedup):
+    # Tüm kanallar tek istemci üzerinden eşzamanlı çekilir; sıralama listedeki önceliği korur
+    results = await asyncio.gather(
+        *(_fetch_channel(client, ch, parser, limit, last_ids.get(ch, 0)) for ch, parser in channels),
+        return_exceptions=True)
+    yeni = []
+    for (channel, _), res in zip(channels, results):
+        if isinstance(res, BaseException):
+            print(f"{channel} kanalı okunamadı: {res!r}")
+            continue
+        last_ids[channel], messages = res
+        yeni.extend(m for m in sorted(messages, key=lambda m: m["date"]) if dedup.add(m))
+    return yeni
+
+async def fetch_whale_messages(client, limit=150, channels=None):
+    return await _fetch_channels(client, channels or whale_channels(), limit, {}, WhaleDedupIndex())
+
+def make_whale_fetcher(client, window_minutes=1440, limit=150, channels=None):
+    # Her turda kanal başına son görülen mesajdan sonrakileri çeker, 24 saatten eskileri atar
+    channels = channels or whale_channels()
+    state = {"messages": [], "last_ids": {}}
+    dedup = WhaleDedupIndex(horizon_minutes=window_minutes)
+
+    async def fetch():
+        yeni = await _fetch_channels(client, channels, limit, state["last_ids"], dedup)
+        sinir = datetime.now(timezone.utc) - timedelta(minutes=window_minutes)
+        state["messages"] = [m for m in state["messages"] + yeni if m["date"] >= sinir]
+        return list(state["messages"])
+    return fetch
+
+def fetch_coingecko_daily(strict=False):
+    gunluk_hacimler = {coin: None for coin in COINGECKO_IDS}
+    gunluk_fiyatlar = {coin: None for coin in COINGECKO_IDS}
+    try:
+        batch = get_coingecko_daily_batch(COINGECKO_IDS)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"CoinGecko günlük verisi alınamadı: {e}")
+        return gunluk_hacimler, gunluk_fiyatlar
+    for coin, (hacim, fiyat) in batch.items():
         gunluk_hacimler[coin] = hacim
-        fiyat, _ = get_daily_price(coin)
         gunluk_fiyatlar[coin] = fiyat
+    return gunluk_hacimler, gunluk_fiyatlar
 
+def report_times(now):
+    now_tr = (now + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M')
+    now_utc = now.strftime('%Y-%m-%d %H:%M')
+    return now_tr, now_utc
+
+def build_whale_sections(per_coin, per_coin_xchain, gunluk_hacimler, gunluk_fiyatlar, now, zscores=None):
+    now_tr, _ = report_times(now)
     btc_whale_report = format_btc_whale_report(
         per_coin["BTC"],
         per_coin_xchain["BTC"],
@@ -1023,14 +2412,1768 @@ async def main():
         gunluk_fiyatlar["BTC"],
         gunluk_hacimler["BTC"] is not None,
         "Veri yok" if gunluk_hacimler["BTC"] is None else "",
-        now_tr
+        now_tr,
+        (zscores or {}).get("BTC")
     )
-
     all_coins_report = format_all_coins_whale_report(
-        per_coin, per_coin_xchain, gunluk_hacimler, gunluk_fiyatlar, now_tr
+        per_coin, per_coin_xchain, gunluk_hacimler, gunluk_fiyatlar, now_tr, zscores
     )
+    return btc_whale_report, all_coins_report
 
-    # Teknik analiz ve kısa vade analizleri
+def veri_yok_bolumu(baslik):
+    return f"━━ {baslik} ━━\nVeri yok\n"
+
+TA_VALUE_KEYS = ("destek", "direnc", "ema7", "ema21", "macd", "rsi", "obv", "trend", "obv_pct")
+
+def build_ta_section(ohlcv, current_price, now, vade, interval=None, symbol="BTCUSDT", derivatives=None):
+    if not ohlcv or len(ohlcv["close"]) < 30 or current_price is None:
+        return {"text": veri_yok_bolumu(f"BTC Teknik Analiz ({vade})"), "score": 0, "max_score": 0}
+    now_tr, now_utc = report_times(now)
+    levels = LEVELS_ENGINE.update(symbol, interval, ohlcv) if interval else None
+    # Piyasa anlık görüntüsü verilmediyse türev metrikleri yerel arşivden okunur
+    if derivatives is None and interval:
+        derivatives = derivatives_metrics(symbol, [interval])[interval]
+    rapor, skor, maxskor, *degerler = btc_teknik_analiz_raporu(
+        ohlcv, current_price, now_tr, now_utc, 0, 1.0, vade=vade, levels=levels, derivatives=derivatives
+    )
+    section = {"text": rapor, "score": skor, "max_score": maxskor, "price": current_price}
+    section.update(zip(TA_VALUE_KEYS, degerler))
+    return section
+
+# --- KURAL MOTORU (DERLENMİŞ, ARTIMLI KOŞUL DEĞERLENDİRME) ---
+RULES_FILE = "rules.json"
+RULE_UNITS = {"USD", "USDT"}
+_RULE_TOKEN = re.compile(
+    r'\s*(?:(?P<num>\d+(?:\.\d+)?)(?P<suf>[KMB](?![A-Za-z0-9_]))?'
+    r'|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<op><=|>=|==|!=|<|>|[-+*/()%]))')
+# NumPy ufunc adları; fonksiyonlar derleme anında çözülür ki modül yüklenirken numpy içe aktarılmasın
+_RULE_COMPARE = {
+    "<": "less", "<=": "less_equal", ">": "greater",
+    ">=": "greater_equal", "==": "equal", "!=": "not_equal"
+}
+_RULE_ARITH = {"+": "add", "-": "subtract", "*": "multiply", "/": "divide"}
+
+class RuleSyntaxError(ValueError):
+    """Kural ifadesi ayrıştırılamadı"""
+
+def tokenize_rule(text):
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _RULE_TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise RuleSyntaxError(f"{pos}. karakterde beklenmeyen ifade: {text[pos:pos + 10]!r}")
+        pos = m.end()
+        if m.group("num"):
+            tokens.append(("num", float(m.group("num")) * _SUFFIX_MULT[m.group("suf") or ""]))
+        elif m.group("name"):
+            name = m.group("name")
+            low = name.lower()
+            if low in ("and", "or", "not"):
+                tokens.append(("op", low))
+            elif tokens and tokens[-1][0] == "num" and (name.upper() in RULE_UNITS or name.upper() in COINGECKO_IDS):
+                continue  # "-500 BTC" gibi birimler sadece okunurluk içindir
+            else:
+                tokens.append(("var", low))
+        elif m.group("op") == "%":
+            if not tokens or tokens[-1][0] != "num":
+                raise RuleSyntaxError("'%' sadece sayıdan sonra kullanılabilir")
+            tokens[-1] = ("num", tokens[-1][1] / 100)
+        else:
+            tokens.append(("op", m.group("op")))
+    return tokens
+
+def parse_rule(text):
+    """Metni ('<', ('var', 'rsi_1h'), ('num', 30.0)) gibi iç içe demetlere çevirir"""
+    tokens = tokenize_rule(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take(*ops):
+        nonlocal pos
+        kind, value = peek()
+        if kind == "op" and value in ops:
+            pos += 1
+            return value
+        return None
+
+    def binary(next_level, ops, kind=None):
+        def parse():
+            node = next_level()
+            while True:
+                op = take(*ops)
+                if op is None:
+                    return node
+                node = (kind or op, node, next_level())
+        return parse
+
+    def factor():
+        nonlocal pos
+        if take("-"):
+            return ("neg", factor())
+        if take("("):
+            node = expr()
+            if not take(")"):
+                raise RuleSyntaxError("')' eksik")
+            return node
+        kind, value = peek()
+        if kind in ("num", "var"):
+            pos += 1
+            return (kind, value)
+        if kind is None:
+            raise RuleSyntaxError("İfade yarım kaldı")
+        raise RuleSyntaxError(f"Beklenmeyen belirteç: {value!r}")
+
+    term = binary(factor, ("*", "/"))
+    arith = binary(term, ("+", "-"))
+
+    def compare():
+        node = arith()
+        op = take(*_RULE_COMPARE)
+        return (op, node, arith()) if op else node
+
+    def negation():
+        if take("not"):
+            return ("not", negation())
+        return compare()
+
+    conj = binary(negation, ("and",))
+    expr = binary(conj, ("or",))
+    node = expr()
+    if pos != len(tokens):
+        raise RuleSyntaxError(f"Fazladan ifade: {tokens[pos][1]!r}")
+    return node
+
+def rule_variables(node):
+    if node[0] == "var":
+        return {node[1]}
+    if node[0] == "num":
+        return set()
+    return set().union(*(rule_variables(c) for c in node[1:]))
+
+class RuleEngine:
+    """Kuralları bir kez derler; ortak alt ifadeler tek düğümdür, sadece girdisi değişenler yeniden hesaplanır"""
+
+    def __init__(self, notify=None):
+        self.notify = notify
+        self.symbols = []
+        self.sym_index = {}
+        self.features = {}
+        self.nodes = {}
+        self.rules = {}
+        self.node_users = {}
+        self.rule_users = {}
+        self.dirty = set()
+
+    def _blank(self):
+        return np.full(len(self.symbols), np.nan)
+
+    def _node(self, key):
+        # Aynı alt ifade (ör. 'rsi_1h < 30') binlerce kuralda geçse de tek düğümde hesaplanır
+        if key in self.nodes:
+            return key
+        kind = key[0]
+        if kind == "num":
+            value = key[1]
+            fn = lambda: value
+        elif kind == "var":
+            name = key[1]
+            self.features.setdefault(name, self._blank())
+            fn = lambda: self.features[name]
+        else:
+            children = [self._node(c) for c in key[1:]]
+            ev = self._eval
+            if kind == "neg":
+                fn = lambda: np.negative(ev(children[0]))
+            elif kind == "not":
+                fn = lambda: np.logical_not(ev(children[0]))
+            elif kind in ("and", "or"):
+                op = np.logical_and if kind == "and" else np.logical_or
+                fn = lambda: op(ev(children[0]), ev(children[1]))
+            else:
+                op = getattr(np, _RULE_COMPARE.get(kind) or _RULE_ARITH[kind])
+                fn = lambda: op(ev(children[0]), ev(children[1]))
+        self.nodes[key] = {"fn": fn, "value": None}
+        for var in rule_variables(key):
+            self.node_users.setdefault(var, set()).add(key)
+        return key
+
+    def _eval(self, key):
+        node = self.nodes[key]
+        if node["value"] is None:
+            node["value"] = node["fn"]()
+        return node["value"]
+
+    def add_rule(self, name, when, symbols=None, message=None, chat_id=None):
+        key = self._node(parse_rule(when))
+        rule = {
+            "name": name, "when": when, "key": key, "message": message, "chat_id": chat_id,
+            "symbols": {s.upper() for s in symbols} if symbols else None,
+            "vars": sorted(rule_variables(key)), "state": np.zeros(len(self.symbols), dtype=bool)
+        }
+        rule["mask"] = self._mask(rule)
+        self.rules[name] = rule
+        for var in rule["vars"]:
+            self.rule_users.setdefault(var, set()).add(name)
+        self.dirty.update(rule["vars"])
+        return rule
+
+    def _mask(self, rule):
+        if rule["symbols"] is None:
+            return None
+        return np.array([s in rule["symbols"] for s in self.symbols], dtype=bool)
+
+    def _add_symbols(self, symbols):
+        # Yeni semboller toplu eklenir; sütunlar ve kural durumları tek seferde genişler
+        new = [s for s in dict.fromkeys(symbols) if s not in self.sym_index]
+        if not new:
+            return
+        for symbol in new:
+            self.sym_index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        pad = np.full(len(new), np.nan)
+        for name, col in self.features.items():
+            self.features[name] = np.concatenate([col, pad])
+        for node in self.nodes.values():
+            node["value"] = None
+        for rule in self.rules.values():
+            rule["state"] = np.concatenate([rule["state"], np.zeros(len(new), dtype=bool)])
+            rule["mask"] = self._mask(rule)
+        self.dirty.update(self.features)
+
+    def update(self, symbol, values):
+        symbol = symbol.upper()
+        self._add_symbols([symbol])
+        i = self.sym_index[symbol]
+        for name, value in values.items():
+            name = name.lower()
+            col = self.features.get(name)
+            if col is None:
+                continue  # hiçbir kuralın kullanmadığı özellik saklanmaz
+            value = np.nan if value is None else float(value)
+            if col[i] != value and not (value != value and col[i] != col[i]):
+                col[i] = value
+                self.dirty.add(name)
+
+    def update_many(self, by_symbol):
+        self._add_symbols([s.upper() for s in by_symbol])
+        for symbol, values in by_symbol.items():
+            self.update(symbol, values)
+
+    def evaluate(self):
+        """Girdisi değişen kuralları hesaplar, yanlıştan doğruya geçen (kural, sembol) çiftlerini döner"""
+        if not self.dirty:
+            return []
+        for var in self.dirty:
+            for key in self.node_users.get(var, ()):
+                self.nodes[key]["value"] = None
+        names = set().union(*(self.rule_users.get(v, set()) for v in self.dirty))
+        self.dirty.clear()
+        alerts = []
+        for name in sorted(names):
+            rule = self.rules[name]
+            hit = np.broadcast_to(self._eval(rule["key"]), rule["state"].shape).astype(bool)
+            if rule["mask"] is not None:
+                hit &= rule["mask"]
+            for i in np.flatnonzero(hit & ~rule["state"]):
+                symbol = self.symbols[i]
+                alerts.append({
+                    "rule": name, "symbol": symbol, "when": rule["when"],
+                    "message": rule["message"], "chat_id": rule["chat_id"],
+                    "values": {v: float(self.features[v][i]) for v in rule["vars"]}
+                })
+            rule["state"] = hit
+        for alert in alerts:
+            if self.notify:
+                try:
+                    self.notify(alert)
+                except Exception as e:
+                    print(f"{alert['rule']} kural bildirimi gönderilemedi: {e}")
+        return alerts
+
+def format_rule_alert(alert):
+    degerler = ", ".join(f"{k}={v:,.4g}" for k, v in alert["values"].items())
+    baslik = alert["message"] or alert["rule"]
+    return f"🔔 {alert['symbol']}: {baslik}\nKoşul: {alert['when']}\nDeğerler: {degerler}"
+
+def send_rule_alert(alert):
+    _telegram_api("sendMessage", chat_id=alert["chat_id"] or config("TELEGRAM_CHAT_ID"), text=format_rule_alert(alert))
+
+def load_rules(engine, path=None):
+    # rules.json: [{"name": ..., "when": "rsi_1h < 30 and whale_net_4h < -500 BTC", "symbols": ["BTC"]}]
+    path = path or config("RULES_FILE", RULES_FILE)
+    if not os.path.exists(path):
+        return engine
+    with open(path) as f:
+        specs = json.load(f)
+    if not isinstance(specs, list):
+        print(f"{path} bir kural listesi içermeli, kurallar yüklenmedi")
+        return engine
+    for n, spec in enumerate(specs):
+        try:
+            if not isinstance(spec, dict):
+                raise RuleSyntaxError(f"Kural bir nesne olmalı, {type(spec).__name__} verildi")
+            if not isinstance(spec.get("when"), str):
+                raise RuleSyntaxError("'when' alanı metin olmalı")
+            symbols = spec.get("symbols")
+            if symbols is not None and not (isinstance(symbols, list) and all(isinstance(x, str) for x in symbols)):
+                raise RuleSyntaxError("'symbols' alanı metin listesi olmalı")
+            engine.add_rule(spec.get("name") or f"kural_{n}", spec["when"], symbols,
+                            spec.get("message"), spec.get("chat_id"))
+        except RuleSyntaxError as e:
+            print(f"{path} içindeki {n}. kural atlandı: {e}")
+    return engine
+
+_rule_engine = None
+
+def get_rule_engine():
+    global _rule_engine
+    if _rule_engine is None:
+        _rule_engine = load_rules(RuleEngine(notify=send_rule_alert))
+    return _rule_engine
+
+TIME_FRAME_KEYS = {5: "5m", 15: "15m", 30: "30m", 60: "1h", 240: "4h", 1440: "24h"}
+
+def whale_features(per_coin):
+    features = {}
+    for coin, frames in per_coin.items():
+        row = features[coin] = {}
+        for (_, data), (_, minutes) in zip(frames, TIME_FRAMES):
+            tf = TIME_FRAME_KEYS[minutes]
+            row[f"whale_in_{tf}"] = data["in_amount"]
+            row[f"whale_out_{tf}"] = data["out_amount"]
+            row[f"whale_net_{tf}"] = data["in_amount"] - data["out_amount"]
+            row[f"whale_net_usd_{tf}"] = data["usd_net_px"]
+    return features
+
+def ta_features(sections, symbol="BTC"):
+    row = {}
+    for interval, section in sections.items():
+        for key, value in section.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[f"{key}_{interval}"] = value
+    return {symbol: row}
+
+def market_features(snapshot, symbol="BTC"):
+    row = {}
+    for interval, values in snapshot.items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[f"{key}_{interval}"] = value
+    return {symbol: row}
+
+def scan_features(results, interval):
+    return {
+        sym[:-4] if sym.endswith("USDT") else sym: {f"{k}_{interval}": v for k, v in r.items()}
+        for sym, r in results.items()
+    }
+
+def check_rules(path=None, expression=None):
+    if expression:
+        try:
+            node = parse_rule(expression)
+        except RuleSyntaxError as e:
+            print(f"Hatalı ifade: {e}")
+            return False
+        print(f"{node}\nDeğişkenler: {', '.join(sorted(rule_variables(node)))}")
+        return True
+    engine = load_rules(RuleEngine(), path)
+    for name, rule in engine.rules.items():
+        print(f"{name}: {rule['when']} | semboller: {', '.join(sorted(rule['symbols'] or ['*']))}")
+    print(f"{len(engine.rules)} kural, {len(engine.nodes)} ortak düğüm")
+    return True
+
+def apply_rule_features(by_symbol, engine=None):
+    engine = engine or get_rule_engine()
+    engine.update_many(by_symbol)
+    return engine.evaluate()
+
+# --- ZAMANLAYICI VE ORTAK ÖNBELLEK ---
+class DataCache:
+    """Kaynak ve analiz çıktılarını sürüm numarasıyla tutan süreç içi önbellek"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            prev = self._data.get(key)
+            version = prev["version"] + 1 if prev else 1
+            self._data[key] = {"value": value, "ts": time.time(), "version": version}
+            return version
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        return entry["value"] if entry else default
+
+    def version(self, key):
+        entry = self._data.get(key)
+        return entry["version"] if entry else 0
+
+    def age(self, key):
+        entry = self._data.get(key)
+        return time.time() - entry["ts"] if entry else None
+
+DATA_CACHE = DataCache()
+
+class RefreshScheduler:
+    """Her kaynağı kendi aralığında yeniler, sadece girdisi değişen analizleri tekrar hesaplar"""
+
+    def __init__(self, cache=None, tick=1.0):
+        self.cache = cache or DATA_CACHE
+        self.tick = tick
+        self.sources = {}
+        self.analyses = {}
+        self.reports = {}
+        self._running = set()
+        # Referansı tutulmayan görevler çalışırken çöp toplanabilir
+        self._tasks = set()
+
+    def add_source(self, name, fetch, interval, max_staleness=None):
+        self.sources[name] = {
+            "fetch": fetch,
+            "interval": interval,
+            "max_staleness": max_staleness or interval * 3,
+            "next_run": 0,
+            "error": None
+        }
+
+    def add_analysis(self, name, func, inputs):
+        # Analizler kayıt sırasıyla çalışır; bir analiz öncekilerin çıktısını girdi alabilir
+        self.analyses[name] = {"func": func, "inputs": list(inputs), "seen": None}
+
+    def add_report(self, name, func, interval, first_delay=None):
+        self.reports[name] = {
+            "func": func,
+            "interval": interval,
+            "next_run": time.time() + (interval if first_delay is None else first_delay)
+        }
+
+    def max_staleness(self, name):
+        if name in self.sources:
+            return self.sources[name]["max_staleness"]
+        # Analizin tazelik bütçesi en sıkı girdisininki kadardır
+        budgets = [self.max_staleness(i) for i in self.analyses.get(name, {}).get("inputs", [])]
+        return min(budgets) if budgets else None
+
+    def is_stale(self, name):
+        age = self.cache.age(name)
+        if age is None:
+            return True
+        if name in self.analyses:
+            return any(self.is_stale(i) for i in self.analyses[name]["inputs"])
+        budget = self.max_staleness(name)
+        return budget is not None and age > budget
+
+    def fresh(self, name):
+        return None if self.is_stale(name) else self.cache.get(name)
+
+    async def _refresh_source(self, name):
+        src = self.sources[name]
+        try:
+            if inspect.iscoroutinefunction(src["fetch"]):
+                value = await src["fetch"]()
+            else:
+                value = await asyncio.to_thread(src["fetch"])
+            self.cache.set(name, value)
+            src["error"] = None
+        except Exception as e:
+            src["error"] = str(e)
+            print(f"{name} kaynağı yenilenemedi: {e}")
+        finally:
+            self._running.discard(name)
+
+    def _start_due_sources(self, now):
+        for name, src in self.sources.items():
+            if name in self._running or now < src["next_run"]:
+                continue
+            src["next_run"] = now + src["interval"]
+            self._running.add(name)
+            task = asyncio.create_task(self._refresh_source(name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def recompute(self):
+        changed = []
+        for name, an in self.analyses.items():
+            versions = tuple(self.cache.version(i) for i in an["inputs"])
+            if 0 in versions or versions == an["seen"]:
+                continue
+            an["seen"] = versions
+            try:
+                self.cache.set(name, an["func"](*[self.cache.get(i) for i in an["inputs"]]))
+                changed.append(name)
+            except Exception as e:
+                print(f"{name} analizi hesaplanamadı: {e}")
+        return changed
+
+    async def _run_due_reports(self, now):
+        for name, rep in self.reports.items():
+            if now < rep["next_run"]:
+                continue
+            rep["next_run"] = now + rep["interval"]
+            try:
+                result = rep["func"](self)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"{name} raporu üretilemedi: {e}")
+
+    async def run(self, stop_event=None):
+        while stop_event is None or not stop_event.is_set():
+            self._start_due_sources(time.time())
+            await asyncio.sleep(self.tick)
+            self.recompute()
+            await self._run_due_reports(time.time())
+
+# Kaynak adı -> (yenileme aralığı sn, tazelik bütçesi sn)
+SOURCE_SCHEDULE = {
+    "whale_messages": (60, 300),
+    "coingecko_daily": (3600, 6 * 3600),
+    "order_book": (10, 60),
+    "market": (120, 600),
+    "ohlcv_5m": (60, 300),
+    "ohlcv_15m": (120, 900),
+    "ohlcv_30m": (300, 1800),
+    "ohlcv_1h": (300, 3600),
+    "ohlcv_4h": (900, 4 * 3600),
+    "ohlcv_1d": (3600, 6 * 3600),
+    "ohlcv_universe": (300, 3600),
+    "price_index": (60, 600)
+}
+OHLCV_LIMITS = {"5m": 150, "15m": 150, "30m": 150, "1h": 200, "4h": 200, "1d": 200}
+REPORT_INTERVAL = 900
+
+def build_scheduler(client, report_interval=REPORT_INTERVAL):
+    s = RefreshScheduler()
+
+    def add(name, fetch):
+        interval, budget = SOURCE_SCHEDULE[name]
+        s.add_source(name, fetch, interval, budget)
+
+    # Kaynaklar strict çağrılır: başarısız yenileme önbellekteki son iyi değerin üzerine yazmaz
+    add("whale_messages", make_whale_fetcher(client))
+    add("coingecko_daily", partial(fetch_coingecko_daily, strict=True))
+    add("order_book", partial(get_order_book_depth, limit=20, strict=True))
+    add("market", partial(collect_market_snapshot, strict=True))
+    for interval, limit in OHLCV_LIMITS.items():
+        add(f"ohlcv_{interval}", partial(get_spot_ohlcv, "BTCUSDT", interval, limit, strict=True))
+    add("ohlcv_universe", partial(fetch_universe_ohlcv, "1h", max(CORRELATION_WINDOWS) + 2, strict=True))
+    add("price_index", PRICE_INDEX.refresh)
+
+    def whale_periods(messages, index):
+        return analyze_all_periods(price_whale_messages(messages, index), datetime.now(timezone.utc))
+
+    def whale(periods, daily, zscores):
+        now = datetime.now(timezone.utc)
+        return build_whale_sections(periods[0], periods[1], daily[0], daily[1], now, zscores)
+
+    def short_term(o5, o15, o30):
+        now_tr, now_utc = report_times(datetime.now(timezone.utc))
+        return btc_kisavadeli_analizler({"5m": o5, "15m": o15, "30m": o30}, None, now_tr, now_utc)
+
+    def ta(vade, interval):
+        def run(ohlcv, ohlcv_1h, market):
+            current_price = ohlcv_1h["close"][-1] if ohlcv_1h["close"] else None
+            return build_ta_section(ohlcv, current_price, datetime.now(timezone.utc), vade, interval,
+                                    derivatives=market.get(interval))
+        return run
+
+    def market_report(market, depth):
+        return format_market_report(annotate_market_anomalies(market, datetime.now(timezone.utc)), depth)
+
+    def correlation(universe):
+        tracker = get_correlation_tracker()
+        tracker.update(universe)
+        return tracker.snapshot()
+
+    def final(ta_1h, ta_4h, ta_1d):
+        return nihai_karar(0, 0, 0, ta_1h["score"], ta_4h["score"], ta_1d["score"], "YOK", "YOK", "YOK")
+
+    s.add_analysis("whale_periods", whale_periods, ["whale_messages", "price_index"])
+    s.add_analysis("whale_zscores", lambda p: whale_flow_zscores(p[0], datetime.now(timezone.utc)), ["whale_periods"])
+    s.add_analysis("whale", whale, ["whale_periods", "coingecko_daily", "whale_zscores"])
+    s.add_analysis("market_report", market_report, ["market", "order_book"])
+    s.add_analysis("correlation", correlation, ["ohlcv_universe"])
+    s.add_analysis("short_term", short_term, ["ohlcv_5m", "ohlcv_15m", "ohlcv_30m"])
+    s.add_analysis("ta_1h", ta("1 Saatlik", "1h"), ["ohlcv_1h", "ohlcv_1h", "market"])
+    s.add_analysis("ta_4h", ta("4 Saatlik", "4h"), ["ohlcv_4h", "ohlcv_1h", "market"])
+    s.add_analysis("ta_1d", ta("1 Günlük", "1d"), ["ohlcv_1d", "ohlcv_1h", "market"])
+    s.add_analysis("final", final, ["ta_1h", "ta_4h", "ta_1d"])
+
+    def archive_run(decision):
+        periods = s.fresh("whale_periods")
+        tas = {iv: s.fresh(f"ta_{iv}") for iv in RUN_TA_INTERVALS}
+        get_run_archive().append(build_run_record(
+            datetime.now(timezone.utc), {iv: v for iv, v in tas.items() if v}, decision,
+            periods[0] if periods else None, s.fresh("market"), source="scheduler"))
+        return True
+
+    s.add_analysis("archive_run", archive_run, ["final"])
+    if get_rule_engine().rules:
+        # Her kaynak grubu kendi analizinde beslenir; biri eksik olsa da diğerleri değerlendirilir
+        s.add_analysis("rules_whale", lambda p: apply_rule_features(whale_features(p[0])), ["whale_periods"])
+        s.add_analysis("rules_ta", lambda a, b, c: apply_rule_features(ta_features({"1h": a, "4h": b, "1d": c})),
+                       ["ta_1h", "ta_4h", "ta_1d"])
+        s.add_analysis("rules_market", lambda m: apply_rule_features(market_features(m)), ["market"])
+    subscriptions = load_subscriptions()
+    if report_interval and subscriptions:
+        s.add_report("subscriptions", SubscriptionFanout(subscriptions).send, report_interval, first_delay=30)
+    elif report_interval:
+        s.add_report("telegram", partial(send_scheduled_report, sender=TelegramReportSender()),
+                     report_interval, first_delay=30)
+    return s
+
+def assemble_scheduled_report(scheduler):
+    def section(name, pick=lambda v: v):
+        value = scheduler.fresh(name)
+        return pick(value) if value is not None else veri_yok_bolumu(name)
+
+    whale = scheduler.fresh("whale")
+    whale_btc, whale_all = whale if whale else (section("whale"), veri_yok_bolumu("all_coins"))
+    return build_report_sections(
+        whale_btc,
+        whale_all,
+        section("market_report"),
+        section("ta_1h", lambda v: v["text"]),
+        section("ta_4h", lambda v: v["text"]),
+        section("ta_1d", lambda v: v["text"]),
+        section("short_term"),
+        section("final", format_nihai_oneri),
+        section("correlation", format_correlation_report)
+    )
+
+def send_scheduled_report(scheduler, sender):
+    results = sender.send_report(assemble_scheduled_report(scheduler))
+    print(f"Zamanlanmış rapor Telegram'a gönderildi: {results}")
+
+# --- ABONELİKLER: YAPILANDIRMA BAŞINA TEK ÜRETİM, EŞZAMANLI DAĞITIM ---
+SUBSCRIPTIONS_FILE = "subscriptions.json"
+SUBSCRIPTION_TIMEFRAMES = tuple(TIME_FRAME_KEYS.values())
+SUBSCRIPTION_TA = {"1h": "ta_1h", "4h": "ta_4h", "24h": "ta_1d"}
+SUBSCRIPTION_INPUTS = (
+    "whale_periods", "coingecko_daily", "whale_zscores", "market_report",
+    "ta_1h", "ta_4h", "ta_1d", "short_term", "final", "correlation"
+)
+FANOUT_CONCURRENCY = 8
+
+def normalize_subscription(spec):
+    coins = {c.upper() for c in spec.get("coins") or ["BTC"]} & set(COINGECKO_IDS)
+    wanted = set(spec.get("timeframes") or SUBSCRIPTION_TIMEFRAMES)
+    # Dil sadece bölüm başlıklarını ve rapor başlığını etkiler; bölüm metinleri Türkçe kalır,
+    # bu yüzden üretim anahtarında yer almaz
+    lang = spec.get("lang", "tr") if spec.get("lang", "tr") in SECTION_TITLES else "tr"
+    # Aynı tercihler farklı sırayla yazılsa da tek yapılandırma anahtarına düşer
+    key = (tuple(sorted(coins)), tuple(tf for tf in SUBSCRIPTION_TIMEFRAMES if tf in wanted))
+    chat_id = str(spec["chat_id"])
+    return {"chat_id": chat_id, "key": key, "lang": lang, "id": f"{chat_id}:{','.join(key[0])}:{','.join(key[1])}"}
+
+def load_subscriptions(path=None):
+    # subscriptions.json: [{"chat_id": 123, "coins": ["BTC", "ETH"], "timeframes": ["1h", "24h"], "lang": "tr"}]
+    path = path or config("SUBSCRIPTIONS_FILE", SUBSCRIPTIONS_FILE)
+    if not os.path.exists(path):
+        return []
+    subscriptions = {}
+    with open(path, encoding="utf-8") as f:
+        for n, spec in enumerate(json.load(f)):
+            try:
+                sub = normalize_subscription(spec)
+            except (KeyError, TypeError, AttributeError) as e:
+                print(f"{path} içindeki {n}. abonelik atlandı: {e!r}")
+                continue
+            # Aynı sohbette aynı filtreler iki kez yazılmışsa tek abonelik sayılır (sonraki dili belirler)
+            if sub["key"][0] and sub["key"][1]:
+                subscriptions[sub["id"]] = sub
+    return list(subscriptions.values())
+
+def render_subscription_sections(scheduler, config_key, now=None):
+    coins, timeframes = config_key
+    now_tr, _ = report_times(now or datetime.now(timezone.utc))
+
+    def section(name, pick=lambda v: v):
+        value = scheduler.fresh(name)
+        return pick(value) if value is not None else veri_yok_bolumu(name)
+
+    idx = [i for i, (_, minutes) in enumerate(TIME_FRAMES) if TIME_FRAME_KEYS[minutes] in timeframes]
+    pick = lambda frames: [frames[i] for i in idx]
+    periods, daily = scheduler.fresh("whale_periods"), scheduler.fresh("coingecko_daily")
+    zscores = scheduler.fresh("whale_zscores") or {}
+    whale = all_coins = None
+    if periods is None or daily is None:
+        whale = veri_yok_bolumu("🐋 Balina Transfer Analizi")
+    else:
+        (per_coin, per_coin_xchain), (hacimler, fiyatlar) = periods, daily
+        if "BTC" in coins:
+            whale = format_btc_whale_report(
+                pick(per_coin["BTC"]), pick(per_coin_xchain["BTC"]), hacimler["BTC"], fiyatlar["BTC"],
+                hacimler["BTC"] is not None, "Veri yok" if hacimler["BTC"] is None else "",
+                now_tr, pick(zscores["BTC"]) if "BTC" in zscores else None)
+        others = [c for c in coins if c != "BTC"]
+        if others:
+            all_coins = format_all_coins_whale_report(
+                {c: pick(per_coin[c]) for c in others}, {c: pick(per_coin_xchain[c]) for c in others},
+                hacimler, fiyatlar, now_tr, {c: pick(zscores[c]) for c in others if c in zscores})
+    btc = "BTC" in coins
+    ta = {tf: section(name, lambda v: v["text"]) if btc and tf in timeframes else None
+          for tf, name in SUBSCRIPTION_TA.items()}
+    return build_report_sections(
+        whale,
+        all_coins,
+        section("market_report") if btc else None,
+        ta["1h"],
+        ta["4h"],
+        ta["24h"],
+        section("short_term") if btc and {"5m", "15m", "30m"} & set(timeframes) else None,
+        section("final", format_nihai_oneri) if btc else None,
+        section("correlation", format_correlation_report) if len(coins) > 1 else None
+    )
+
+class SubscriptionFanout:
+    """Her farklı (coinler, zaman dilimleri) yapılandırmasını bir kez üretir, abonelere eşzamanlı dağıtır"""
+
+    def __init__(self, subscriptions, concurrency=FANOUT_CONCURRENCY):
+        self.subscriptions = subscriptions
+        self.concurrency = concurrency
+        self.rendered = {}
+        self.senders = {}
+
+    def render(self, scheduler):
+        # Girdilerin sürümü ve tazeliği değişmediyse önceki turun metni aynen kullanılır
+        state = tuple((scheduler.cache.version(n), scheduler.is_stale(n)) for n in SUBSCRIPTION_INPUTS)
+        out = {}
+        for key in dict.fromkeys(s["key"] for s in self.subscriptions):
+            cached = self.rendered.get(key)
+            if cached is None or cached[0] != state:
+                self.rendered[key] = (state, render_subscription_sections(scheduler, key))
+            out[key] = self.rendered[key][1]
+        return out
+
+    def sender(self, sub):
+        sender = self.senders.get(sub["id"])
+        if sender is None or sender.lang != sub["lang"]:
+            sender = self.senders[sub["id"]] = TelegramReportSender(
+                chat_id=sub["chat_id"], lang=sub["lang"], state_key=sub["id"])
+        return sender
+
+    async def send(self, scheduler):
+        rendered = self.render(scheduler)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(sub):
+            async with semaphore:
+                return await asyncio.to_thread(self.sender(sub).send_report, rendered[sub["key"]])
+
+        results = await asyncio.gather(*(deliver(s) for s in self.subscriptions), return_exceptions=True)
+        failed = 0
+        for sub, result in zip(self.subscriptions, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                print(f"{sub['chat_id']} abonesine rapor gönderilemedi: {result!r}")
+        print(f"Abonelik raporu: {len(rendered)} yapılandırma, {len(self.subscriptions)} abone, {failed} hata")
+        return results
+
+async def run_scheduler(report_interval=REPORT_INTERVAL):
+    client = make_telegram_client()
+    await client.start()
+    print("Telegram'a bağlanıldı, zamanlayıcı başlatılıyor.")
+    await build_scheduler(client, report_interval).run()
+
+# --- SALT OKUNUR HTTP API ---
+API_HOST = "127.0.0.1"
+API_PORT = 8080
+API_MAX_BODY = 64 * 1024
+API_IDLE_TIMEOUT = 15  # sn; boşta bekleyen keep-alive bağlantısı kapatılır
+HTTP_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+def timeframe_key(minutes):
+    return f"{minutes}m" if minutes < 60 else f"{minutes // 60}h"
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, datetime):
+        return o.isoformat()
+    raise TypeError(f"JSON'a çevrilemiyor: {type(o).__name__}")
+
+def to_json_bytes(payload):
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, default=_json_default).encode("utf-8")
+
+class ApiCache:
+    """Her yol için önceden serileştirilmiş JSON gövdesi ve ETag tutar"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def publish(self, path, payload):
+        body = to_json_bytes(payload)
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        entry = self._entries.get(path)
+        if entry and entry["etag"] == etag:
+            return False
+        # Girdi tek atamada değişir; okuyan taraf kilitsiz okuyabilir
+        self._entries[path] = {"body": body, "etag": etag, "updated": time.time()}
+        if path != "/":
+            self._entries["/"] = self._index_entry()
+        return True
+
+    def _index_entry(self):
+        body = to_json_bytes({"paths": sorted(p for p in self._entries if p != "/")})
+        return {"body": body, "etag": '"' + hashlib.sha1(body).hexdigest()[:20] + '"', "updated": time.time()}
+
+    def get(self, path):
+        return self._entries.get(path)
+
+API_CACHE = ApiCache()
+
+def whale_summary_payload(per_coin):
+    return {
+        coin: {timeframe_key(minutes): data for (_, data), (_, minutes) in zip(rows, TIME_FRAMES)}
+        for coin, rows in per_coin.items()
+    }
+
+def publish_whales(periods, cache=None):
+    cache = cache or API_CACHE
+    summary = whale_summary_payload(periods[0])
+    cache.publish("/whales", summary)
+    for coin, frames in summary.items():
+        cache.publish(f"/whales/{coin}", frames)
+        for tf, data in frames.items():
+            cache.publish(f"/whales/{coin}/{tf}", data)
+
+def ta_payload(section):
+    return {k: v for k, v in section.items() if k != "text"}
+
+def publish_ta(ta_1h, ta_4h, ta_1d, cache=None):
+    cache = cache or API_CACHE
+    payload = {"1h": ta_payload(ta_1h), "4h": ta_payload(ta_4h), "1d": ta_payload(ta_1d)}
+    cache.publish("/ta", payload)
+    for tf, values in payload.items():
+        cache.publish(f"/ta/{tf}", values)
+
+def publish_market(snapshot, depth, cache=None):
+    cache = cache or API_CACHE
+    bids, asks = depth if depth else (None, None)
+    cache.publish("/market", {"intervals": snapshot, "depth": {"bids": bids, "asks": asks}})
+
+def publish_decision(final, cache=None):
+    (cache or API_CACHE).publish("/decision", final)
+
+def publish_correlation(snapshot, cache=None):
+    (cache or API_CACHE).publish("/correlation", correlation_payload(snapshot))
+
+def register_api_analyses(scheduler, cache=None):
+    # API gövdeleri sadece ilgili analiz değişince yeniden serileştirilir
+    scheduler.add_analysis("api_whales", partial(publish_whales, cache=cache), ["whale_periods"])
+    scheduler.add_analysis("api_ta", partial(publish_ta, cache=cache), ["ta_1h", "ta_4h", "ta_1d"])
+    scheduler.add_analysis("api_market", partial(publish_market, cache=cache), ["market", "order_book"])
+    scheduler.add_analysis("api_decision", partial(publish_decision, cache=cache), ["final"])
+    scheduler.add_analysis("api_correlation", partial(publish_correlation, cache=cache), ["correlation"])
+
+def _http_response(status, body=b"", headers=None, head_only=False):
+    lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+    hdrs = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(body))}
+    hdrs.update(headers or {})
+    lines += [f"{k}: {v}" for k, v in hdrs.items()]
+    raw = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return raw if head_only or status == 304 else raw + body
+
+async def _handle_api_client(reader, writer, cache):
+    def read_line():
+        return asyncio.wait_for(reader.readline(), API_IDLE_TIMEOUT)
+
+    try:
+        while True:
+            request_line = await read_line()
+            if not request_line:
+                break
+            parts = request_line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await read_line()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            if len(parts) != 3:
+                writer.write(_http_response(400, b'{"error": "gecersiz istek"}', {"Connection": "close"}))
+                break
+            method, target, version = parts
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            # Gövde kullanılmaz ama okunup atılır; aksi halde sonraki istek satırı sanılır.
+            # Uzunluğu bilinmeyen veya çok büyük gövdede bağlantı yanıttan sonra kapatılır
+            length = headers.get("content-length", "0").strip() or "0"
+            if "transfer-encoding" in headers or not length.isdigit() or int(length) > API_MAX_BODY:
+                keep_alive = False
+            elif int(length):
+                await asyncio.wait_for(reader.readexactly(int(length)), API_IDLE_TIMEOUT)
+            path = target.split("?", 1)[0].rstrip("/") or "/"
+            entry = cache.get(path)
+            common = {} if keep_alive else {"Connection": "close"}
+            if method not in ("GET", "HEAD"):
+                response = _http_response(405, b'{"error": "sadece GET"}', {"Allow": "GET, HEAD", **common})
+            elif entry is None:
+                response = _http_response(404, b'{"error": "bulunamadi"}', common, head_only=method == "HEAD")
+            else:
+                common.update({
+                    "ETag": entry["etag"],
+                    "Cache-Control": "no-cache",
+                    "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(entry["updated"]))
+                })
+                tags = {t.strip() for t in headers.get("if-none-match", "").split(",")}
+                if entry["etag"] in tags or "*" in tags:
+                    response = _http_response(304, headers=common)
+                else:
+                    response = _http_response(200, entry["body"], common, head_only=method == "HEAD")
+            writer.write(response)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_api(cache=None, host=API_HOST, port=API_PORT):
+    server = await asyncio.start_server(
+        partial(_handle_api_client, cache=cache or API_CACHE), host, port)
+    print(f"API dinleniyor: http://{host}:{port}/")
+    return server
+
+async def run_service(host=API_HOST, port=API_PORT, report_interval=None):
+    client = make_telegram_client()
+    await client.start()
+    scheduler = build_scheduler(client, report_interval)
+    register_api_analyses(scheduler)
+    server = await serve_api(host=host, port=port)
+    async with server:
+        await scheduler.run()
+
+# --- PERFORMANS ÖLÇÜMÜ VE SENTETİK VERİ ---
+BENCH_RESULTS_FILE = "bench_results.jsonl"
+BENCH_SIZES = (200, 2000)
+
+def generate_synthetic_ohlcv(n, seed=0, start_price=30000.0, interval_ms=3600000, vol=0.004):
+    # Geometrik rastgele yürüyüş; hacim fiyat hareketinin büyüklüğüyle artar
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, vol, n)
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0, vol / 2, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.gamma(2.0, 50.0, n) * (1 + 50 * np.abs(returns))
+    ts = 1_600_000_000_000 + np.arange(n, dtype=np.int64) * interval_ms
+    return {
+        "open": open_.tolist(), "high": high.tolist(), "low": low.tolist(),
+        "close": close.tolist(), "volume": volume.tolist(), "ts": ts.tolist()
+    }
+
+def generate_whale_texts(n, seed=0, now=None, span_minutes=1440):
+    # Whale Alert kanal biçiminde metin ve mesaj zamanı üretir
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now(timezone.utc)
+    coins = list(COINGECKO_IDS)
+    prices = {"BTC": 60000, "ETH": 3000, "USDT": 1, "SOL": 150, "XRP": 0.6, "DOGE": 0.15}
+    wallets = [f"#{x.capitalize()}" for x in EXCHANGES] + ["unknown wallet", "unknown new wallet"]
+    out = []
+    for _ in range(n):
+        coin = coins[rng.integers(len(coins))]
+        usd = float(rng.uniform(1e6, 2e8))
+        amount = usd / prices.get(coin, 1)
+        src, dst = rng.choice(len(wallets), 2, replace=False)
+        text = (
+            f"🚨 {amount:,.0f} #{coin} ({usd:,.0f} USD) transferred "
+            f"from {wallets[src]} to {wallets[dst]}"
+        )
+        date = now - timedelta(minutes=float(rng.uniform(0, span_minutes)))
+        out.append((text, date))
+    return out
+
+def generate_whale_messages(n, seed=0, now=None):
+    messages = []
+    for text, date in generate_whale_texts(n, seed, now):
+        parsed = parse_whale_alert(text)
+        if parsed:
+            parsed["date"] = date
+            messages.append(parsed)
+    return messages
+
+def _bench_cases(size):
+    ohlcv = generate_synthetic_ohlcv(size)
+    close, high, low, volume = (ohlcv[k] for k in ("close", "high", "low", "volume"))
+    now = datetime.now(timezone.utc)
+    texts = [t for t, _ in generate_whale_texts(size, now=now)]
+    messages = generate_whale_messages(size, now=now)
+    per_coin, per_coin_xchain = analyze_all_periods(messages, now)
+    hacimler = {c: 1e9 for c in COINGECKO_IDS}
+    fiyatlar = {c: 1.0 for c in COINGECKO_IDS}
+    market = {iv: {"funding_rate": 0.0001, "ls_ratio": 1.1, "open_interest": 1e5,
+                   "spot_volume": 1e3, "futures_volume": 1e8} for iv, _ in MARKET_INTERVALS}
+    universe = {c: generate_synthetic_ohlcv(size, seed=i) for i, c in enumerate(COINGECKO_IDS)}
+    short = {"5m": ohlcv, "15m": ohlcv, "30m": ohlcv}
+    return {
+        "ema": lambda: ema(close, 21),
+        "macd": lambda: macd(close, 12, 26, 9),
+        "rsi": lambda: rsi(close, 14),
+        "stoch_rsi": lambda: stoch_rsi(close, 14),
+        "mfi": lambda: mfi(high, low, close, volume, 14),
+        "adx": lambda: adx(high, low, close, 14),
+        "obv": lambda: obv(close, volume),
+        "bollinger": lambda: bollinger(close, 20, 2),
+        "atr": lambda: atr(high, low, close, 14),
+        "parse_whale_alert": lambda: [parse_whale_alert(t) for t in texts],
+        "analyze_all_periods": lambda: analyze_all_periods(messages, now),
+        "score_ta_report": lambda: btc_teknik_analiz_raporu(ohlcv, close[-1], "", "", 0, 1.0),
+        "score_short_term": lambda: btc_kisavadeli_analizler(short, close[-1], "", ""),
+        "backtest_strategy": lambda: backtest_strategy(ohlcv),
+        "format_btc_whale_report": lambda: format_btc_whale_report(
+            per_coin["BTC"], per_coin_xchain["BTC"], 1e9, 60000, True, "", ""),
+        "format_all_coins_whale_report": lambda: format_all_coins_whale_report(
+            per_coin, per_coin_xchain, hacimler, fiyatlar, ""),
+        "format_market_report": lambda: format_market_report(market, (10.0, 12.0)),
+        "levels_engine": lambda: LevelsEngine().update("BENCH", "1h", ohlcv),
+        "correlation": lambda: CorrelationTracker(list(COINGECKO_IDS)).update(universe)
+    }
+
+def _git_commit():
+    import subprocess
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+def time_callable(func, repeat=5, min_time=0.05):
+    import statistics
+    # Tek çalıştırma çok kısaysa döngü sayısı min_time'a ulaşacak şekilde büyütülür
+    t0 = time.perf_counter()
+    func()
+    single = time.perf_counter() - t0
+    number = max(1, int(min_time / single)) if single > 0 else 1000
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - t0) / number)
+    return {"min": min(samples), "median": statistics.median(samples), "number": number, "repeat": repeat}
+
+def run_benchmarks(sizes=BENCH_SIZES, names=None, repeat=5, output=BENCH_RESULTS_FILE):
+    import platform
+    record = {
+        "commit": _git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": {}
+    }
+    for size in sizes:
+        for name, func in _bench_cases(size).items():
+            if names and name not in names:
+                continue
+            r = time_callable(func, repeat=repeat)
+            record["results"][f"{name}[{size}]"] = r
+            print(f"{name}[{size}]: {r['median'] * 1e3:.3f} ms (min {r['min'] * 1e3:.3f} ms)")
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    return record
+
+def load_benchmarks(path=BENCH_RESULTS_FILE):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare_benchmarks(base=None, head=None, path=BENCH_RESULTS_FILE):
+    # Varsayılan: dosyadaki son iki kayıt; commit verilirse o commit'in son kaydı
+    records = load_benchmarks(path)
+
+    def pick(commit, default_idx):
+        if commit is None:
+            return records[default_idx]
+        return [r for r in records if r["commit"].startswith(commit)][-1]
+
+    old, new = pick(base, -2), pick(head, -1)
+    print(f"{old['commit']} → {new['commit']}")
+    rows = []
+    for name, r in new["results"].items():
+        if name in old["results"]:
+            ratio = r["median"] / old["results"][name]["median"]
+            rows.append((name, old["results"][name]["median"], r["median"], ratio))
+            flag = "  ⚠️" if ratio > 1.1 else ""
+            print(f"{name:40s} {rows[-1][1] * 1e3:10.3f} ms {r['median'] * 1e3:10.3f} ms  x{ratio:.2f}{flag}")
+    return rows
+
+# --- YEREL MUM ARŞİVİ (BACKFILL) ---
+KLINE_STORE_DIR = os.path.join("data", "klines")
+KLINE_BACKFILL_DAYS = 7  # backfill komutunun varsayılanı
+KLINE_FIELDS = ("ts", "open", "high", "low", "close", "volume")
+INTERVAL_MS = {
+    "1m": 60000, "5m": 300000, "15m": 900000, "30m": 1800000,
+    "1h": 3600000, "4h": 14400000, "1d": 86400000
+}
+
+def kline_store_path(symbol, interval):
+    return os.path.join(KLINE_STORE_DIR, f"{symbol}_{interval}.npz")
+
+def load_klines(symbol, interval):
+    path = kline_store_path(symbol, interval)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {k: data[k] for k in KLINE_FIELDS}
+
+def save_npz(path, arrays):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path[:-4] + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+def save_klines(symbol, interval, klines):
+    save_npz(kline_store_path(symbol, interval), klines)
+
+def fetch_klines_range(symbol, interval, start_ms, end_ms, limit=1000):
+    step = INTERVAL_MS[interval]
+    chunks = []
+    while start_ms < end_ms:
+        url = (
+            f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval={interval}"
+            f"&startTime={start_ms}&endTime={end_ms}&limit={limit}"
+        )
+        ohlcv = parse_klines(http_request("GET", url, "binance_spot", max_retry=3).json())
+        # Boş veya ilerlemeyen sayfada dur (tekrar oynatmada son kayıtlı sayfa yinelenir)
+        if not ohlcv["ts"] or ohlcv["ts"][-1] < start_ms:
+            break
+        chunks.append(ohlcv)
+        start_ms = ohlcv["ts"][-1] + step
+    return {
+        k: np.array([v for c in chunks for v in c[k]], dtype=np.int64 if k == "ts" else float)
+        for k in KLINE_FIELDS
+    }
+
+def backfill_klines(symbol, interval, days=30):
+    # Var olan arşivin sonundan devam eder; sadece kapanmış mumlar saklanır
+    step = INTERVAL_MS[interval]
+    now_ms = int(time.time() * 1000)
+    end_ms = now_ms - now_ms % step
+    existing = load_klines(symbol, interval)
+    if existing is not None and len(existing["ts"]):
+        start_ms = int(existing["ts"][-1]) + step
+    else:
+        start_ms = end_ms - days * 86400000
+    fresh = fetch_klines_range(symbol, interval, start_ms, end_ms - 1)
+    closed = fresh["ts"] + step <= now_ms
+    fresh = {k: v[closed] for k, v in fresh.items()}
+    if existing is not None:
+        merged = {k: np.concatenate([existing[k], fresh[k]]) for k in KLINE_FIELDS}
+        _, keep = np.unique(merged["ts"], return_index=True)
+        fresh_count = len(keep) - len(existing["ts"])
+        merged = {k: v[keep] for k, v in merged.items()}
+    else:
+        merged, fresh_count = fresh, len(fresh["ts"])
+    if len(merged["ts"]):
+        save_klines(symbol, interval, merged)
+    print(f"{symbol} {interval}: {fresh_count} yeni mum, toplam {len(merged['ts'])}")
+    return fresh_count
+
+# --- VADELİ İŞLEM GEÇMİŞİ (FONLAMA, AÇIK POZİSYON, LONG/SHORT) ---
+DERIVATIVES_STORE_DIR = os.path.join("data", "derivatives")
+DERIVATIVES_PERIOD = "5m"
+DERIVATIVES_DAYS = 30  # futures/data uç noktaları en fazla son 30 günü verir
+DERIVATIVES_REPORT_PAGES = 1  # rapor yolunda seri başına en fazla bu kadar sayfa; tam doldurma backfill ile
+DERIVATIVES_BACKFILL_DAYS = 7  # backfill --derivatives varsayılanı; en fazla DERIVATIVES_DAYS
+FUNDING_INTERVAL_MS = 8 * 3600000
+FUNDING_EXTREME_PCT = 90
+DERIVATIVE_SERIES = {
+    "funding": {"path": "/fapi/v1/fundingRate", "time": "fundingTime", "limit": 1000, "period": False,
+                "fields": {"rate": "fundingRate", "mark_price": "markPrice"}},
+    "open_interest": {"path": "/futures/data/openInterestHist", "time": "timestamp", "limit": 500, "period": True,
+                      "fields": {"oi": "sumOpenInterest", "oi_value": "sumOpenInterestValue"}},
+    "long_short": {"path": "/futures/data/globalLongShortAccountRatio", "time": "timestamp", "limit": 500,
+                   "period": True, "fields": {"ratio": "longShortRatio", "long": "longAccount"}}
+}
+
+def derivatives_store_path(symbol, series, period=DERIVATIVES_PERIOD):
+    suffix = f"_{period}" if DERIVATIVE_SERIES[series]["period"] else ""
+    return os.path.join(DERIVATIVES_STORE_DIR, f"{symbol}_{series}{suffix}.npz")
+
+def load_derivatives(symbol, series, period=DERIVATIVES_PERIOD):
+    path = derivatives_store_path(symbol, series, period)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {k: data[k] for k in data.files}
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def fetch_derivatives_range(symbol, series, start_ms, end_ms, period=DERIVATIVES_PERIOD, max_pages=None):
+    spec = DERIVATIVE_SERIES[series]
+    step = INTERVAL_MS[period] if spec["period"] else FUNDING_INTERVAL_MS
+    rows = []
+    pages = 0
+    while start_ms < end_ms and (max_pages is None or pages < max_pages):
+        # Her istek en fazla 'limit' adımlık pencere ister; sayfalama zaman üzerinden ilerler
+        chunk_end = min(end_ms, start_ms + spec["limit"] * step - 1)
+        url = (
+            f"https://fapi.binance.com{spec['path']}?symbol={symbol}"
+            f"&startTime={start_ms}&endTime={chunk_end}&limit={spec['limit']}"
+        )
+        if spec["period"]:
+            url += f"&period={period}"
+        rows.extend(http_request("GET", url, "binance_futures", max_retry=3).json())
+        start_ms = chunk_end + 1
+        pages += 1
+    out = {"ts": np.array([int(r[spec["time"]]) for r in rows], dtype=np.int64)}
+    for name, key in spec["fields"].items():
+        out[name] = np.array([_to_float(r.get(key)) for r in rows], dtype=float)
+    return out
+
+def update_derivatives(symbol, series, period=DERIVATIVES_PERIOD, days=DERIVATIVES_DAYS, max_pages=None):
+    # backfill_klines gibi var olan arşivin sonundan devam eder.
+    # max_pages verilirse (rapor yolu) boş arşiv doldurulmaz, sadece sınırlı sayıda sayfa çekilir;
+    # arşiv çok gerideyse boşluk bırakmadan sonraki çalıştırmalarda yetişir
+    now_ms = int(time.time() * 1000)
+    existing = load_derivatives(symbol, series, period)
+    if existing is not None and len(existing["ts"]):
+        start_ms = int(existing["ts"][-1]) + 1
+    elif max_pages is not None:
+        return 0
+    else:
+        start_ms = now_ms - days * 86400000
+    fresh = fetch_derivatives_range(symbol, series, start_ms, now_ms, period, max_pages)
+    merged = {k: np.concatenate([existing[k], fresh[k]]) for k in fresh} if existing is not None else fresh
+    _, keep = np.unique(merged["ts"], return_index=True)
+    merged = {k: v[keep] for k, v in merged.items()}
+    fresh_count = len(keep) - (len(existing["ts"]) if existing is not None else 0)
+    if len(merged["ts"]):
+        save_npz(derivatives_store_path(symbol, series, period), merged)
+    return fresh_count
+
+def refresh_derivatives(symbol="BTCUSDT", period=DERIVATIVES_PERIOD, days=DERIVATIVES_DAYS, max_pages=None):
+    counts = {}
+    for series in DERIVATIVE_SERIES:
+        try:
+            counts[series] = update_derivatives(symbol, series, period, days, max_pages)
+        except Exception as e:
+            print(f"{symbol} {series} geçmişi güncellenemedi: {e}")
+    return counts
+
+def percentile_rank(history, value):
+    history = np.sort(history[~np.isnan(history)])
+    if not len(history) or value is None or np.isnan(value):
+        return None
+    below = np.searchsorted(history, value, side="left")
+    upto = np.searchsorted(history, value, side="right")
+    return float((below + upto) / 2 / len(history) * 100)
+
+def window_changes(ts, values, windows_ms):
+    # Tüm pencerelerin başlangıç noktaları tek searchsorted ile bulunur; kapsanmayan pencere NaN
+    windows_ms = np.asarray(windows_ms, dtype=np.int64)
+    start = ts[-1] - windows_ms
+    idx = np.minimum(np.searchsorted(ts, start, side="left"), len(ts) - 1)
+    base = values[idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = (values[-1] / base - 1) * 100
+    return np.where((ts[0] <= start) & (base > 0), pct, np.nan)
+
+def oi_regime(oi_change, price_change):
+    if oi_change > 0:
+        return "Yeni long girişi, yükseliş teyitli" if price_change > 0 else "Yeni short girişi, düşüş baskısı"
+    return "Short kapanışı, yükseliş zayıf" if price_change > 0 else "Long tasfiyesi, satış yorulabilir"
+
+def derivatives_metrics(symbol="BTCUSDT", intervals=None, period=DERIVATIVES_PERIOD, current_funding=None):
+    # current_funding verilirse (anlık oran) yüzdelik ona göre, yoksa son kapanan fonlamaya göre
+    intervals = intervals or [iv for iv, _ in MARKET_INTERVALS]
+    metrics = {iv: {} for iv in intervals}
+    funding = load_derivatives(symbol, "funding")
+    if funding is not None and len(funding["ts"]):
+        current = funding["rate"][-1] if current_funding is None else current_funding
+        pct = percentile_rank(funding["rate"], current)
+        for row in metrics.values():
+            row["funding_pct"] = pct
+    oi = load_derivatives(symbol, "open_interest", period)
+    if oi is not None and len(oi["ts"]) >= 2:
+        # Toplam değer / kontrat miktarı = kayıt anındaki fiyat; ayrı fiyat serisi gerekmez
+        with np.errstate(divide="ignore", invalid="ignore"):
+            price = oi["oi_value"] / oi["oi"]
+        windows = [INTERVAL_MS[iv] for iv in intervals]
+        oi_changes = window_changes(oi["ts"], oi["oi"], windows)
+        price_changes = window_changes(oi["ts"], price, windows)
+        for iv, oi_ch, px_ch in zip(intervals, oi_changes.tolist(), price_changes.tolist()):
+            if oi_ch == oi_ch and px_ch == px_ch:
+                metrics[iv].update(oi_change=oi_ch, price_change=px_ch, oi_regime=oi_regime(oi_ch, px_ch))
+    ls = load_derivatives(symbol, "long_short", period)
+    if ls is not None and len(ls["ts"]):
+        pct = percentile_rank(ls["ratio"], ls["ratio"][-1])
+        for row in metrics.values():
+            row["ls_pct"] = pct
+    return metrics
+
+# --- ZAMAN NOKTASI FİYAT ENDEKSİ (1m MUMLAR) ---
+PRICE_INDEX_INTERVAL = "1m"
+PRICE_INDEX_RETENTION_MINUTES = 2 * 1440
+PRICE_MAX_GAP_MS = 5 * 60000
+
+class PriceIndex:
+    """Coin başına sıralı mum zamanları ve kapanışları; searchsorted ile toplu fiyat sorgusu"""
+
+    def __init__(self, retention_minutes=PRICE_INDEX_RETENTION_MINUTES, max_gap_ms=PRICE_MAX_GAP_MS):
+        self.retention_ms = retention_minutes * 60000 if retention_minutes else None
+        self.max_gap_ms = max_gap_ms
+        self.ts = {}
+        self.close = {}
+
+    def update(self, coin, ts, close):
+        ts = np.asarray(ts, dtype=np.int64)
+        close = np.asarray(close, dtype=float)
+        if not len(ts):
+            return
+        old_ts, old_close = self.ts.get(coin), self.close.get(coin)
+        if old_ts is None or not len(old_ts):
+            ts, keep = np.unique(ts, return_index=True)
+            close = close[keep]
+        elif ts[0] > old_ts[-1] and np.all(np.diff(ts) > 0):
+            ts, close = np.concatenate([old_ts, ts]), np.concatenate([old_close, close])
+        else:
+            # Yeni gelen mum (ör. kapanmamış son mum) eskisinin üzerine yazılır
+            ts, keep = np.unique(np.concatenate([ts, old_ts]), return_index=True)
+            close = np.concatenate([close, old_close])[keep]
+        if self.retention_ms:
+            start = np.searchsorted(ts, ts[-1] - self.retention_ms)
+            ts, close = ts[start:], close[start:]
+        self.ts[coin], self.close[coin] = ts, close
+
+    def prices(self, coin, ts_ms):
+        """Her zaman damgası için o ana ait mumun kapanışı; kapsam dışındaysa NaN"""
+        ts_ms = np.asarray(ts_ms, dtype=np.int64)
+        out = np.full(len(ts_ms), np.nan)
+        idx_ts = self.ts.get(coin)
+        if idx_ts is None or not len(idx_ts):
+            return out
+        i = np.searchsorted(idx_ts, ts_ms, side="right") - 1
+        ok = (i >= 0) & (ts_ms - idx_ts[np.maximum(i, 0)] < self.max_gap_ms)
+        out[ok] = self.close[coin][i[ok]]
+        return out
+
+    def value(self, coin, ts_ms, amounts):
+        return self.prices(coin, ts_ms) * np.asarray(amounts, dtype=float)
+
+    def refresh(self, coins=None, lookback_minutes=1440):
+        # İlk turda yerel arşiv + son pencere, sonra sadece son mumdan itibaren çekilir
+        now_ms = int(time.time() * 1000)
+        for coin in coins or COINGECKO_IDS:
+            symbol = binance_symbol(coin)
+            if not symbol:
+                continue
+            if coin not in self.ts:
+                stored = load_klines(symbol, PRICE_INDEX_INTERVAL)
+                if stored is not None:
+                    self.update(coin, stored["ts"], stored["close"])
+            have = self.ts.get(coin)
+            start_ms = int(have[-1]) if have is not None and len(have) else now_ms - lookback_minutes * 60000
+            try:
+                fresh = fetch_klines_range(symbol, PRICE_INDEX_INTERVAL, start_ms, now_ms)
+            except Exception as e:
+                print(f"{symbol} fiyat endeksi güncellenemedi: {e}")
+                continue
+            self.update(coin, fresh["ts"], fresh["close"])
+        return self
+
+PRICE_INDEX = PriceIndex()
+
+def price_whale_messages(messages, index=None):
+    # Her transferi kendi zamanındaki fiyatla değerler; fiyat yoksa alarmın USD değeri kalır
+    index = index or PRICE_INDEX
+    by_coin = {}
+    for m in messages:
+        by_coin.setdefault(m["coin"], []).append(m)
+    shift_ms = TRANSPORT["shift"].total_seconds() * 1000
+    for coin, ms in by_coin.items():
+        ts_ms = np.fromiter((m["date"].timestamp() * 1000 - shift_ms for m in ms), dtype=float, count=len(ms))
+        amounts = np.fromiter((m["amount"] for m in ms), dtype=float, count=len(ms))
+        usd = index.value(coin, ts_ms.astype(np.int64), amounts)
+        for m, v in zip(ms, usd.tolist()):
+            m["usd_px"] = m["usd"] if v != v else v
+    return messages
+
+# --- PAYLAŞIMLI BELLEK ÖZELLİK DEPOSU (ÇOK SÜREÇLİ GÖSTERGE HESABI) ---
+FEATURE_FIELDS = ("open", "high", "low", "close", "volume")
+FEATURE_OUTPUTS = ("score", "max_score", "price", "ema7", "ema21", "macd", "rsi", "mfi", "adx", "obv", "atr")
+
+class SharedFeatureStore:
+    """OHLCV'yi [sembol, alan, mum] ve sonuçları [sembol, özellik] düzeninde tek paylaşımlı blokta tutar"""
+
+    def __init__(self, symbols, n_bars, name=None):
+        from multiprocessing import shared_memory
+        self.symbols = list(symbols)
+        self.index = {sym: i for i, sym in enumerate(self.symbols)}
+        self.n_bars = n_bars
+        n = len(self.symbols)
+        bars_size = n * len(FEATURE_FIELDS) * n_bars * 8
+        size = bars_size + n * 8 + n * len(FEATURE_OUTPUTS) * 8
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        buf = self.shm.buf
+        self.bars = np.ndarray((n, len(FEATURE_FIELDS), n_bars), dtype=np.float64, buffer=buf)
+        self.lengths = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=bars_size)
+        self.results = np.ndarray((n, len(FEATURE_OUTPUTS)), dtype=np.float64, buffer=buf, offset=bars_size + n * 8)
+        if self.owner:
+            self.lengths[:] = 0
+            self.results[:] = np.nan
+
+    def spec(self):
+        # İşçilere sadece bu küçük sözlük gider; veri kopyalanmaz
+        return {"name": self.shm.name, "symbols": self.symbols, "n_bars": self.n_bars}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["symbols"], spec["n_bars"], name=spec["name"])
+
+    def write(self, symbol, ohlcv):
+        i = self.index[symbol]
+        n = min(len(ohlcv["close"]), self.n_bars)
+        for f, field in enumerate(FEATURE_FIELDS):
+            self.bars[i, f, :n] = np.asarray(ohlcv[field][-n:], dtype=np.float64) if n else 0
+        self.lengths[i] = n
+
+    def view(self, i):
+        n = self.lengths[i]
+        return {field: self.bars[i, f, :n] for f, field in enumerate(FEATURE_FIELDS)}
+
+    def read_results(self):
+        return {
+            sym: {k: (None if np.isnan(v) else float(v)) for k, v in zip(FEATURE_OUTPUTS, self.results[i])}
+            for sym, i in self.index.items()
+        }
+
+    def close(self):
+        # ndarray görünümleri bırakılmadan paylaşımlı blok kapatılamaz
+        self.bars = self.lengths = self.results = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def _last_value(arr):
+    return float(arr[-1]) if isinstance(arr, np.ndarray) and len(arr) else None
+
+def compute_feature_row(high, low, close, volume):
+    ema7 = _last_value(ema(close, 7))
+    ema21 = _last_value(ema(close, 21))
+    macd_line = _last_value(macd(close, 12, 26, 9)[0])
+    rsi_val = _last_value(rsi(close, 14))
+    mfi_val = _last_value(mfi(high, low, close, volume, 14))
+    adx_val = _last_value(adx(high, low, close, 14))
+    obv_val = _last_value(obv(close, volume))
+    atr_now = _last_value(atr(high, low, close, 14))
+    volatility_txt = volatility_level(atr_now, close[-1])
+    score, max_score, _ = technical_score(
+        ema7, ema21, macd_line, rsi_val, mfi_val, adx_val, obv_val,
+        atr_now, volatility_txt, trend_strength_score(adx_val), 0, 1.0)
+    row = [score, max_score, close[-1], ema7, ema21, macd_line, rsi_val, mfi_val, adx_val, obv_val, atr_now]
+    return [np.nan if v is None else v for v in row]
+
+_worker_store = None
+
+def _attach_feature_worker(spec):
+    global _worker_store
+    _worker_store = SharedFeatureStore.attach(spec)
+
+def _compute_feature_rows(indices):
+    store = _worker_store
+    for i in indices:
+        v = store.view(i)
+        if len(v["close"]) >= 30:
+            store.results[i] = compute_feature_row(v["high"], v["low"], v["close"], v["volume"])
+    return len(indices)
+
+def analyze_symbols_parallel(ohlcv_by_symbol, workers=None, n_bars=500):
+    from concurrent.futures import ProcessPoolExecutor
+    # Verisi olmayan semboller süreç havuzuna girmez; hiç veri yoksa sıfır boyutlu paylaşımlı blok açılmaz
+    empty = {sym: dict.fromkeys(FEATURE_OUTPUTS) for sym, o in ohlcv_by_symbol.items() if not len(o["close"])}
+    symbols = [sym for sym in ohlcv_by_symbol if sym not in empty]
+    if not symbols:
+        return empty
+    store = SharedFeatureStore(symbols, n_bars)
+    try:
+        for sym in symbols:
+            store.write(sym, ohlcv_by_symbol[sym])
+        workers = max(1, min(workers or os.cpu_count() or 1, len(symbols)))
+        chunks = [list(range(len(symbols)))[k::workers] for k in range(workers)]
+        with ProcessPoolExecutor(workers, initializer=_attach_feature_worker, initargs=(store.spec(),)) as ex:
+            list(ex.map(_compute_feature_rows, chunks))
+        return {**store.read_results(), **empty}
+    finally:
+        store.close()
+
+def scan_universe(symbols, interval="1h", limit=500, workers=None):
+    ohlcv_by_symbol = {}
+    for sym in symbols:
+        stored = load_klines(sym, interval)
+        if stored is not None and len(stored["ts"]) >= 30:
+            ohlcv_by_symbol[sym] = {k: stored[k][-limit:] for k in FEATURE_FIELDS}
+        else:
+            ohlcv_by_symbol[sym] = get_spot_ohlcv(sym, interval, min(limit, 1000))
+    results = analyze_symbols_parallel(ohlcv_by_symbol, workers, n_bars=limit)
+    if get_rule_engine().rules:
+        apply_rule_features(scan_features(results, interval))
+    ranked = sorted(
+        results.items(),
+        key=lambda kv: -(kv[1]["score"] / kv[1]["max_score"]) if kv[1]["max_score"] else 0)
+    for sym, r in ranked:
+        if r["max_score"] is None:
+            print(f"{sym}: Veri yok")
+            continue
+        rsi_s = f"{r['rsi']:.1f}" if r["rsi"] is not None else "-"
+        print(f"{sym}: Skor {r['score']:+.0f}/{r['max_score']:.0f} | RSI {rsi_s} | Fiyat {r['price']:,.4f}")
+    return results
+
+# --- ÇALIŞTIRMA ARŞİVİ (PARQUET) ---
+RUN_ARCHIVE_DIR = os.path.join("data", "runs")
+RUN_ARCHIVE_BATCH = 32
+RUN_ARCHIVE_FLUSH_SECONDS = 3600
+RUN_TA_INTERVALS = ("1h", "4h", "1d")
+RUN_TA_KEYS = ("score", "max_score", "price", "rsi", "ema7", "ema21", "macd", "obv", "obv_pct", "destek", "direnc")
+RUN_MARKET_KEYS = (
+    "funding_rate", "ls_ratio", "open_interest", "spot_volume", "futures_volume",
+    "oi_change", "price_change", "funding_pct", "ls_pct", "spot_volume_z", "futures_volume_z"
+)
+KARAR_KODLARI = {"AL": 1, "TUT": 0, "SAT": -1}
+
+def run_archive_columns():
+    columns = [f"{k}_{iv}" for iv in RUN_TA_INTERVALS for k in RUN_TA_KEYS]
+    columns += [f"{k}_{iv}" for iv, _ in MARKET_INTERVALS for k in RUN_MARKET_KEYS]
+    columns += [
+        f"{coin.lower()}_whale_{kind}_{tf}"
+        for coin in COINGECKO_IDS for tf in TIME_FRAME_KEYS.values() for kind in ("in", "out", "net", "net_usd")
+    ]
+    return columns
+
+def run_archive_schema():
+    # Şema sabit: eksik veri null yazılır, ay bölümleri arasında sütunlar hep aynı kalır
+    import pyarrow as pa
+    fields = [
+        pa.field("run_ts", pa.timestamp("ms", tz="UTC")),
+        pa.field("source", pa.string()),
+        pa.field("karar", pa.string()),
+        pa.field("karar_kod", pa.int8())
+    ]
+    return pa.schema(fields + [pa.field(c, pa.float64()) for c in run_archive_columns()])
+
+def _numeric(value):
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+def build_run_record(now, ta_sections=None, decision=None, per_coin=None, market=None, source="report"):
+    record = {
+        "run_ts": now, "source": source,
+        "karar": decision["karar"] if decision else None,
+        "karar_kod": KARAR_KODLARI.get(decision["karar"]) if decision else None
+    }
+    for interval, section in (ta_sections or {}).items():
+        for key in RUN_TA_KEYS:
+            record[f"{key}_{interval}"] = _numeric(section.get(key))
+    for coin, row in whale_features(per_coin or {}).items():
+        for name, value in row.items():
+            record[f"{coin.lower()}_{name}"] = _numeric(value)
+    for interval, row in (market or {}).items():
+        for key in RUN_MARKET_KEYS:
+            record[f"{key}_{interval}"] = _numeric(row.get(key))
+    return record
+
+class RunArchive:
+    """Çalıştırma kayıtlarını bellekte biriktirir, toplu halde aylık bölümlere Parquet olarak yazar"""
+
+    def __init__(self, root=RUN_ARCHIVE_DIR, batch_size=RUN_ARCHIVE_BATCH, flush_seconds=RUN_ARCHIVE_FLUSH_SECONDS):
+        self.root = root
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.buffer = []
+        self.last_flush = time.time()
+        self._lock = threading.Lock()
+        # pyarrow (ve pandas uyumluluk katmanı) şimdi yüklenir: çıkışta ilk kez içe aktarılırsa
+        # threading kapanmış olduğundan atexit'teki flush başarısız olur
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet  # noqa: F401
+            pa.Table.from_pylist([], schema=run_archive_schema())
+        except ImportError:
+            pass
+        atexit.register(self.flush)
+
+    def append(self, record):
+        with self._lock:
+            self.buffer.append(record)
+            due = len(self.buffer) >= self.batch_size or time.time() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self.buffer = self.buffer, []
+            self.last_flush = time.time()
+        if not records:
+            return 0
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print(f"pyarrow kurulu değil, {len(records)} çalıştırma kaydı arşivlenemedi")
+            return 0
+        schema = run_archive_schema()
+        by_month = {}
+        for record in records:
+            by_month.setdefault(record["run_ts"].strftime("%Y-%m"), []).append(record)
+        for month, rows in by_month.items():
+            part_dir = os.path.join(self.root, f"month={month}")
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, f"part-{int(time.time() * 1000)}-{os.getpid()}.parquet")
+            pq.write_table(pa.Table.from_pylist(rows, schema=schema), path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+        return len(records)
+
+_run_archive = None
+
+def get_run_archive():
+    global _run_archive
+    if _run_archive is None:
+        _run_archive = RunArchive()
+    return _run_archive
+
+def _run_archive_files(root, start=None, end=None):
+    if not os.path.isdir(root):
+        return {}
+    first = start.strftime("%Y-%m") if start else None
+    last = end.strftime("%Y-%m") if end else None
+    files = {}
+    for name in sorted(os.listdir(root)):
+        month = name.partition("=")[2]
+        if not name.startswith("month=") or (first and month < first) or (last and month > last):
+            continue
+        part_dir = os.path.join(root, name)
+        files[month] = [os.path.join(part_dir, f) for f in sorted(os.listdir(part_dir)) if f.endswith(".parquet")]
+    return files
+
+def compact_run_archive(root=RUN_ARCHIVE_DIR):
+    # Tek seferlik çalıştırmaların bıraktığı küçük dosyaları ay başına tek dosyada birleştirir
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    merged = 0
+    for month, files in _run_archive_files(root).items():
+        if len(files) < 2:
+            continue
+        table = ds.dataset(files, format="parquet", schema=run_archive_schema()).to_table().sort_by("run_ts")
+        path = os.path.join(root, f"month={month}", f"compact-{int(time.time() * 1000)}.parquet")
+        pq.write_table(table, path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+        for f in files:
+            os.remove(f)
+        merged += len(files)
+    return merged
+
+def load_runs(start=None, end=None, columns=None, root=RUN_ARCHIVE_DIR, as_pandas=False):
+    """Aralıktaki çalıştırmaları run_ts'e göre sıralı yükler; NumPy dizileri sözlüğü veya DataFrame döner"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    files = [f for month_files in _run_archive_files(root, start, end).values() for f in month_files]
+    schema = run_archive_schema()
+    if columns is not None:
+        columns = ["run_ts"] + [c for c in columns if c != "run_ts"]
+    if files:
+        ts_type = schema.field("run_ts").type
+        condition = None
+        if start:
+            condition = ds.field("run_ts") >= pa.scalar(start, type=ts_type)
+        if end:
+            upper = ds.field("run_ts") < pa.scalar(end, type=ts_type)
+            condition = upper if condition is None else condition & upper
+        table = ds.dataset(files, format="parquet", schema=schema).to_table(columns=columns, filter=condition)
+        table = table.sort_by("run_ts")
+    else:
+        table = schema.empty_table().select(columns or schema.names)
+    if as_pandas:
+        return table.to_pandas()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+def evaluate_decisions(runs, horizons=(1, 4, 24), price_column="price_1h"):
+    # Her kararın fiyatı, h saat sonraki ilk çalıştırmanın fiyatıyla karşılaştırılır (tek searchsorted)
+    ts = np.asarray(runs["run_ts"]).astype("datetime64[ms]").astype(np.int64)
+    price = np.asarray(runs[price_column], dtype=float)
+    kod = np.asarray(runs["karar_kod"], dtype=float)
+    results = {name: {} for name in KARAR_KODLARI}
+    if not len(ts):
+        return results
+    for h in horizons:
+        target = ts + h * 3600000
+        j = np.minimum(np.searchsorted(ts, target, side="left"), len(ts) - 1)
+        ok = (ts[j] >= target) & (ts[j] - target <= max(h * 900000, 900000))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fwd = np.where(ok, price[j] / price - 1, np.nan)
+        for name, code in KARAR_KODLARI.items():
+            sel = fwd[(kod == code) & ~np.isnan(fwd)]
+            if code:
+                getiri = sel * code
+                results[name][f"{h}h"] = {
+                    "adet": int(len(sel)),
+                    "ort_getiri": float(getiri.mean()) if len(sel) else None,
+                    "isabet": float((getiri > 0).mean()) if len(sel) else None
+                }
+            else:
+                results[name][f"{h}h"] = {
+                    "adet": int(len(sel)),
+                    "ort_mutlak_hareket": float(np.abs(sel).mean()) if len(sel) else None
+                }
+    return results
+
+def report_decision_performance(days=30, compact=False):
+    if compact:
+        print(f"{compact_run_archive()} küçük dosya birleştirildi.")
+    end = datetime.now(timezone.utc)
+    runs = load_runs(end - timedelta(days=days), end, columns=["karar_kod", "price_1h"])
+    print(f"Son {days} gün: {len(runs['run_ts'])} çalıştırma")
+    for karar, by_h in evaluate_decisions(runs).items():
+        for h, stats in by_h.items():
+            detay = ", ".join(f"{k}: {v:.4f}" if isinstance(v, float) else f"{k}: {v}" for k, v in stats.items())
+            print(f"{karar} {h}: {detay}")
+
+# --- RAPOR ÇALIŞTIRMALARI ---
+async def collect_whale_report(now, client=None):
+    # Whale Alert kanalından son 150 mesajı çek; istemci kurulamazsa (kimlik bilgisi yok vb.) bölümler "Veri yok" olur
+    async def baglan_ve_cek():
+        nonlocal client
+        client = client or make_telegram_client()
+        await client.start()
+        print("Telegram'a bağlanıldı.")
+        return await fetch_whale_messages(client, limit=150)
+
+    messages = None
+    try:
+        messages = await asyncio.wait_for(
+            baglan_ve_cek(), timeout=max(0.5, deadline_remaining("telegram_mtproto")))
+        print(f"{len(messages)} adet balina transferi bulundu.")
+    except Exception as e:
+        print(f"Balina mesajları alınamadı: {e!r}")
+
+    gunluk_hacimler, gunluk_fiyatlar = fetch_coingecko_daily()
+    if messages is None:
+        return (veri_yok_bolumu("🐋 Balina Transfer Analizi"),
+                veri_yok_bolumu("🐋 Balina Transfer Analizi (Tüm Coinler)"), None)
+    price_whale_messages(messages, PRICE_INDEX.refresh({m["coin"] for m in messages}))
+    per_coin, per_coin_xchain = analyze_all_periods(messages, now)
+    zscores = whale_flow_zscores(per_coin, now)
+    return build_whale_sections(per_coin, per_coin_xchain, gunluk_hacimler, gunluk_fiyatlar, now, zscores) + (per_coin,)
+
+def collect_ta_report(now, market=None):
+    now_tr, now_utc = report_times(now)
     ohlcv_1h = get_spot_ohlcv("BTCUSDT", "1h", 200)
     ohlcv_5m = get_spot_ohlcv("BTCUSDT", "5m", 150)
     ohlcv_15m = get_spot_ohlcv("BTCUSDT", "15m", 150)
@@ -1041,50 +4184,212 @@ async def main():
     kisa_vade_analiz = btc_kisavadeli_analizler(ohlcv_dict, current_price, now_tr, now_utc)
 
     # 1h, 4h, 1d teknik analiz skorlarını ve verilerini topla
-    teknik_rapor_1h, skor_1h, maxskor_1h, _, _, _, _, _, _, _, _, _ = btc_teknik_analiz_raporu(
-        ohlcv_1h, current_price, now_tr, now_utc, 0, 1.0, vade="1 Saatlik"
-    )
+    market = market or {}
+    ta_1h = build_ta_section(ohlcv_1h, current_price, now, "1 Saatlik", "1h", derivatives=market.get("1h"))
     ohlcv_4h = get_spot_ohlcv("BTCUSDT", "4h", 200)
-    teknik_rapor_4h, skor_4h, maxskor_4h, _, _, _, _, _, _, _, _, _ = btc_teknik_analiz_raporu(
-        ohlcv_4h, current_price, now_tr, now_utc, 0, 1.0, vade="4 Saatlik"
-    )
+    ta_4h = build_ta_section(ohlcv_4h, current_price, now, "4 Saatlik", "4h", derivatives=market.get("4h"))
     ohlcv_1d = get_spot_ohlcv("BTCUSDT", "1d", 200)
-    teknik_rapor_1d, skor_1d, maxskor_1d, _, _, _, _, _, _, _, _, _ = btc_teknik_analiz_raporu(
-        ohlcv_1d, current_price, now_tr, now_utc, 0, 1.0, vade="1 Günlük"
-    )
+    ta_1d = build_ta_section(ohlcv_1d, current_price, now, "1 Günlük", "1d", derivatives=market.get("1d"))
 
-    nihai = nihai_oneri(
-        0, 0, 0, skor_1h, skor_4h, skor_1d, "YOK", "YOK", "YOK"
+    karar = nihai_karar(
+        0, 0, 0, ta_1h["score"], ta_4h["score"], ta_1d["score"], "YOK", "YOK", "YOK"
     )
-    
-    # Piyasa verileri
-    market_report = btc_piyasa_analiz_turkce()
+    return {
+        "ohlcv_1h": ohlcv_1h, "ta_1h": ta_1h, "ta_4h": ta_4h, "ta_1d": ta_1d,
+        "short_term": kisa_vade_analiz, "final": format_nihai_oneri(karar), "decision": karar
+    }
+
+def deliver_sections(sections, send=True):
+    # Rapor toplandı; gönderim kendi devre kesicisiyle sınırlı, çalıştırma süresine bağlı değil
+    set_run_deadline(None)
+    if not send:
+        print(join_report_sections(sections))
+        return
+    results = TelegramReportSender().send_report(sections)
+    print(f"Rapor Telegram'a gönderildi: {results}")
+
+async def main(send=True, plot=True):
+    # Çalıştırma süresi sınırlı: geç gelen kaynaklar "Veri yok" olarak rapora girer
+    set_run_deadline(RunDeadline(RUN_DEADLINE_SECONDS, SOURCE_BUDGETS))
+    now = datetime.now(timezone.utc)
+
+    # Telegram bağlantısı, balina mesajları ve BTC için analiz
+    btc_whale_report, all_coins_report, per_coin = await collect_whale_report(now)
+
+    # Piyasa verileri; türev arşivi burada güncellendiği için teknik analizden önce
+    snapshot = None
+    try:
+        snapshot = annotate_market_anomalies(collect_market_snapshot(), now)
+        market_report = format_market_report(snapshot, get_order_book_depth(limit=20))
+    except Exception as e:
+        print(f"Piyasa verileri alınamadı: {e}")
+        market_report = veri_yok_bolumu("BTC Piyasa Verileri")
+
+    # Teknik analiz ve kısa vade analizleri
+    ta = collect_ta_report(now, snapshot)
+    # Coinler arası korelasyon
+    tracker = get_correlation_tracker()
+    tracker.update(fetch_universe_ohlcv("1h", max(CORRELATION_WINDOWS) + 2))
+    correlation_report = format_correlation_report(tracker.snapshot())
+
     # Sonuç mesajı
-    rapor = (
-        btc_whale_report
-        + "\n\n"
-        + all_coins_report
-        + "\n"
-        + market_report
-        + "\n"
-        + teknik_rapor_1h
-        + "\n"
-        + teknik_rapor_4h
-        + "\n"
-        + teknik_rapor_1d
-        + "\n"
-        + kisa_vade_analiz
-        + "\n"
-        + nihai
+    sections = build_report_sections(
+        btc_whale_report,
+        all_coins_report,
+        market_report,
+        ta["ta_1h"]["text"],
+        ta["ta_4h"]["text"],
+        ta["ta_1d"]["text"],
+        ta["short_term"],
+        ta["final"],
+        correlation_report
     )
+    deliver_sections(sections, send)
 
-    send_telegram_message(rapor)
-    print("Rapor Telegram'a gönderildi.")
+    # Yapısal kayıt; tekrar oynatma çalıştırmaları gerçek arşive yazılmaz
+    if TRANSPORT["mode"] != "replay":
+        get_run_archive().append(build_run_record(
+            now, {iv: ta[f"ta_{iv}"] for iv in RUN_TA_INTERVALS}, ta["decision"], per_coin, snapshot))
 
     # Grafik çizimi
-    print("Grafik oluşturuluyor...")
-    plot_technical_indicators(ohlcv_1h)
+    if plot and ta["ohlcv_1h"]["close"]:
+        print("Grafik oluşturuluyor...")
+        plot_technical_indicators(ta["ohlcv_1h"])
+
+async def run_whales(send=True):
+    set_run_deadline(RunDeadline(RUN_DEADLINE_SECONDS, SOURCE_BUDGETS))
+    now = datetime.now(timezone.utc)
+    whale, all_coins, _ = await collect_whale_report(now)
+    deliver_sections([("whale", whale), ("all_coins", all_coins)], send)
+
+def run_ta(send=True):
+    set_run_deadline(RunDeadline(RUN_DEADLINE_SECONDS, SOURCE_BUDGETS))
+    ta = collect_ta_report(datetime.now(timezone.utc))
+    deliver_sections([
+        ("ta_1h", ta["ta_1h"]["text"]),
+        ("ta_4h", ta["ta_4h"]["text"]),
+        ("ta_1d", ta["ta_1d"]["text"]),
+        ("short_term", ta["short_term"]),
+        ("final", ta["final"])
+    ], send)
+
+def run_backtest(symbol="BTCUSDT", interval="1h", limit=500, lookback=50):
+    # Yerel arşiv varsa onu, yoksa Binance'ten son mumları kullanır
+    stored = load_klines(symbol, interval)
+    if stored is not None and len(stored["ts"]) > lookback:
+        ohlcv = {k: stored[k][-limit:].tolist() for k in KLINE_FIELDS}
+    else:
+        ohlcv = get_spot_ohlcv(symbol, interval, limit)
+    if len(ohlcv["close"]) <= lookback + 1:
+        print("Backtest için yeterli veri yok.")
+        return None
+    signals = np.array(backtest_strategy(ohlcv, lookback))
+    close = np.asarray(ohlcv["close"], dtype=float)
+    # signals[i], close[lookback + i] anındaki karar; bir sonraki mumun getirisiyle ölçülür
+    fwd = close[lookback + 1:] / close[lookback:-1] - 1
+    sig = signals[:len(fwd)]
+    out = {}
+    for name, value in (("AL", 1), ("SAT", -1)):
+        hits = fwd[sig == value] * value
+        out[name] = {"adet": int(len(hits)), "ort_getiri": float(hits.mean()) if len(hits) else None}
+        ort = f"{out[name]['ort_getiri'] * 100:+.3f}%" if len(hits) else "-"
+        print(f"{symbol} {interval} {name}: {len(hits)} sinyal, sonraki mum ortalama getiri {ort}")
+    return out
+
+def build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog="3.py", description="BTC balina ve teknik analiz raporu")
+    parser.add_argument("--record", metavar="ARŞİV", help="dış kaynak yanıtlarını arşive kaydet")
+    parser.add_argument("--replay", metavar="ARŞİV", help="dış kaynaklar yerine arşivi kullan")
+    parser.add_argument("--latency", type=float, default=0.0, help="tekrar oynatmada kayıtlı gecikme çarpanı")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("report", help="tam rapor (varsayılan)")
+    p.add_argument("--no-send", action="store_true", help="Telegram'a göndermek yerine yazdır")
+    p.add_argument("--no-plot", action="store_true", help="grafik çizme")
+    p = sub.add_parser("whales", help="sadece balina bölümleri")
+    p.add_argument("--no-send", action="store_true")
+    p = sub.add_parser("ta", help="sadece teknik analiz bölümleri")
+    p.add_argument("--no-send", action="store_true")
+    p = sub.add_parser("backtest", help="RSI/MACD stratejisini geriye dönük test et")
+    p.add_argument("--symbol", default="BTCUSDT")
+    p.add_argument("--interval", default="1h")
+    p.add_argument("--limit", type=int, default=500)
+    p = sub.add_parser("serve", help="zamanlayıcı + salt okunur JSON API")
+    p.add_argument("--host", default=API_HOST)
+    p.add_argument("--port", type=int, default=API_PORT)
+    p.add_argument("--report-interval", type=int, default=0, help="0: Telegram raporu gönderme")
+    p = sub.add_parser("scheduler", help="kademeli yenileme ile sürekli rapor")
+    p.add_argument("--report-interval", type=int, default=REPORT_INTERVAL)
+    p = sub.add_parser("backfill", help="geçmiş mumları yerel arşive indir")
+    p.add_argument("--symbols", default=",".join(filter(None, map(binance_symbol, COINGECKO_IDS))))
+    p.add_argument("--interval", default="1m")
+    p.add_argument("--days", type=int, default=None,
+                   help=f"varsayılan: mumlar {KLINE_BACKFILL_DAYS}, türevler {DERIVATIVES_BACKFILL_DAYS} gün")
+    p.add_argument("--derivatives", action="store_true", help="mumlar yerine fonlama/açık pozisyon/L-S geçmişi")
+    p = sub.add_parser("rules", help="kural dosyasını doğrula veya tek bir ifadeyi ayrıştır")
+    p.add_argument("--file", default=None, help="kural dosyası (varsayılan rules.json)")
+    p.add_argument("--check", metavar="İFADE", help="sadece bu ifadeyi ayrıştır")
+    p = sub.add_parser("scan", help="çok sembollü paralel gösterge taraması")
+    p.add_argument("--symbols", default=",".join(filter(None, map(binance_symbol, COINGECKO_IDS))))
+    p.add_argument("--interval", default="1h")
+    p.add_argument("--limit", type=int, default=500)
+    p.add_argument("--workers", type=int, default=0)
+    p = sub.add_parser("bench", help="sıcak yolların performans ölçümü")
+    p.add_argument("--sizes", default=",".join(map(str, BENCH_SIZES)))
+    p.add_argument("--names", default="")
+    p = sub.add_parser("runs", help="arşivlenmiş nihai kararların isabetini ölç")
+    p.add_argument("--days", type=int, default=30)
+    p.add_argument("--compact", action="store_true", help="önce küçük Parquet dosyalarını birleştir")
+    p = sub.add_parser("bench-pipeline", help="kayıtlı arşivle uçtan uca ölçüm")
+    p.add_argument("archive")
+    p.add_argument("--runs", type=int, default=3)
+    return parser
+
+def cli(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.record:
+        set_transport("record", args.record)
+    elif args.replay:
+        set_transport("replay", args.replay, args.latency)
+    command = args.command or "report"
+    send = not getattr(args, "no_send", False)
+    if command == "report":
+        asyncio.run(main(send=send, plot=not getattr(args, "no_plot", False)))
+    elif command == "whales":
+        asyncio.run(run_whales(send))
+    elif command == "ta":
+        run_ta(send)
+    elif command == "backtest":
+        run_backtest(args.symbol, args.interval, args.limit)
+    elif command == "serve":
+        asyncio.run(run_service(args.host, args.port, args.report_interval or None))
+    elif command == "scheduler":
+        asyncio.run(run_scheduler(args.report_interval))
+    elif command == "backfill":
+        for symbol in filter(None, args.symbols.split(",")):
+            if args.derivatives:
+                days = min(args.days or DERIVATIVES_BACKFILL_DAYS, DERIVATIVES_DAYS)
+                print(f"{symbol}: {refresh_derivatives(symbol, days=days)}")
+            else:
+                backfill_klines(symbol, args.interval, args.days or KLINE_BACKFILL_DAYS)
+    elif command == "rules":
+        check_rules(args.file, args.check)
+    elif command == "scan":
+        scan_universe(list(filter(None, args.symbols.split(","))), args.interval, args.limit, args.workers or None)
+    elif command == "bench":
+        sizes = tuple(int(x) for x in args.sizes.split(","))
+        run_benchmarks(sizes, names=set(filter(None, args.names.split(","))) or None)
+    elif command == "runs":
+        report_decision_performance(args.days, args.compact)
+    elif command == "bench-pipeline":
+        bench_pipeline(args.archive, args.runs, args.latency)
+    if TRANSPORT["mode"] == "replay" and TRANSPORT["archive"].misses:
+        misses = sorted(set(TRANSPORT["archive"].misses))
+        print(f"Tekrar oynatma eksik: {len(misses)} istek arşivde yok")
+        for key in misses:
+            print(f"  {key}")
+        raise SystemExit(1)
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    cli()